@@ -1,7 +1,7 @@
 import csv
 from collections import defaultdict
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.db.models import F
 from utils.common import pretty_url
 from .models import Bundle
@@ -34,14 +34,16 @@ def bundle_view(request, slug):
     )
 
 
-def csv_view(request, slug):
-    bundle = Bundle.objects.get(slug=slug)
+class _Echo:
+    """file-like object that returns what is written, for streaming csv rows"""
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = f'attachment; filename="{slug}.csv"'
+    def write(self, value):
+        return value
 
+
+def _csv_rows(bundle):
     writer = csv.DictWriter(
-        response,
+        _Echo(),
         fieldnames=[
             "state",
             "session",
@@ -53,7 +55,7 @@ def csv_view(request, slug):
             "openstates_url",
         ],
     )
-    writer.writeheader()
+    yield writer.writeheader()
 
     for bill in (
         bundle.bills.all()
@@ -61,8 +63,9 @@ def csv_view(request, slug):
             "legislative_session__jurisdiction",
         )
         .order_by(F("first_action_date").desc(nulls_last=True))
+        .iterator()
     ):
-        writer.writerow(
+        yield writer.writerow(
             {
                 "state": bill.legislative_session.jurisdiction.name,
                 "session": bill.legislative_session.identifier,
@@ -74,4 +77,12 @@ def csv_view(request, slug):
                 "openstates_url": "https://openstates.org/" + pretty_url(bill),
             }
         )
+
+
+def csv_view(request, slug):
+    bundle = Bundle.objects.get(slug=slug)
+
+    # rows are streamed (& compressed) as they're written
+    response = StreamingHttpResponse(_csv_rows(bundle), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{slug}.csv"'
     return response
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class GraphapiConfig(AppConfig):
+    name = "graphapi"
+
+    def ready(self):
+        from django.db.models.signals import post_save
+        from openstates.data.models import RunPlan
+        from .caching import invalidate_last_scraped
+
+        post_save.connect(invalidate_last_scraped, sender=RunPlan)
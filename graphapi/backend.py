@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from graphql import parse, print_ast, validate, execute
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult
+
+
+def document_hash(document_string):
+    return hashlib.sha256(document_string.encode("utf8")).hexdigest()
+
+
+class CachedDocument(GraphQLDocument):
+    """a parsed & validated document, safe to execute without re-validation"""
+
+    def __init__(self, schema, document_string, document_ast, execute_params):
+        super().__init__(schema, document_string, document_ast, self._execute)
+        self.execute_params = execute_params
+        # hash of the printed AST, the same for queries that only differ in formatting
+        self.normalized_hash = document_hash(print_ast(document_ast))
+        # QueryProtectionMiddleware stores the cost of each root field here
+        self.costs = {}
+
+    def _execute(self, *args, **kwargs):
+        # expose the document on the request so middleware can reuse per-document data
+        context = kwargs.get("context_value")
+        if context is not None:
+            context.graphql_document = self
+        params = dict(self.execute_params, **kwargs)
+        return execute(self.schema, self.document_ast, *args, **params)
+
+
+class CachedGraphQLBackend(GraphQLCoreBackend):
+    """
+    GraphQL backend that keeps an LRU cache of parsed & validated documents
+
+    documents are keyed by a hash of the query text, so repeated queries skip
+    parsing and validation entirely, invalid documents are never cached
+    """
+
+    def __init__(self, max_size=500, executor=None):
+        super().__init__(executor=executor)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def document_from_string(self, schema, document_string):
+        # pre-parsed documents don't come from clients, don't bother caching them
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+
+        key = (id(schema), document_hash(document_string))
+        with self._lock:
+            document = self._cache.get(key)
+            if document is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        if errors:
+            return GraphQLDocument(
+                schema,
+                document_string,
+                document_ast,
+                lambda *args, **kwargs: ExecutionResult(errors=errors, invalid=True),
+            )
+
+        document = CachedDocument(
+            schema, document_string, document_ast, self.execute_params
+        )
+        with self._lock:
+            self._cache[key] = document
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return document
+
+    def stats(self):
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
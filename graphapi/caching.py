@@ -0,0 +1,299 @@
+import json
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max, Q
+from graphql.execution.values import get_argument_values
+from graphql.language.ast import Field, OperationDefinition, Variable
+from openstates.data.models import RunPlan
+from utils.common import queryset_version, weak_etag
+from .backend import document_hash
+
+# root fields whose results are scoped to a single jurisdiction, and the argument(s)
+# identifying it, any other root field is versioned on all jurisdictions
+JURISDICTION_ARGUMENTS = {
+    "bills": ("jurisdiction",),
+    "bill": ("jurisdiction",),
+    "jurisdiction": ("id", "name"),
+}
+
+
+def _get_operation(document_ast, operation_name):
+    for definition in document_ast.definitions:
+        if isinstance(definition, OperationDefinition):
+            if not operation_name or (
+                definition.name and definition.name.value == operation_name
+            ):
+                return definition
+    return None
+
+
+def _argument_value(argument, variables):
+    if isinstance(argument.value, Variable):
+        return (variables or {}).get(argument.value.name.value)
+    return getattr(argument.value, "value", None)
+
+
+def get_jurisdictions(document_ast, operation_name, variables):
+    """
+    get the jurisdictions (ids or names) a query is scoped to
+
+    returns None if any root field isn't limited to a known jurisdiction
+    """
+    operation = _get_operation(document_ast, operation_name)
+    if operation is None:
+        return None
+
+    jurisdictions = set()
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, Field):
+            return None
+        if selection.name.value == "__typename":
+            continue
+        value = None
+        for argument in selection.arguments:
+            if argument.name.value in JURISDICTION_ARGUMENTS.get(
+                selection.name.value, ()
+            ):
+                value = _argument_value(argument, variables)
+        if not isinstance(value, str) or not value:
+            return None
+        jurisdictions.add(value)
+    return jurisdictions
+
+
+def data_version(jurisdictions):
+    """
+    get the data version for a set of jurisdictions (or all if None)
+
+    the version is the end time of the latest successful scrape, so cached
+    responses are invalidated as soon as new data lands
+    """
+    cache = caches["default"]
+    key = "gqlversion~" + ("|".join(sorted(jurisdictions)) if jurisdictions else "*")
+    version = cache.get(key)
+    if version is None:
+        runs = RunPlan.objects.filter(success=True)
+        if jurisdictions:
+            scope = Q()
+            for jurisdiction in jurisdictions:
+                if jurisdiction.startswith("ocd-jurisdiction"):
+                    scope |= Q(jurisdiction_id=jurisdiction)
+                else:
+                    scope |= Q(jurisdiction__name=jurisdiction)
+            runs = runs.filter(scope)
+        latest = runs.aggregate(latest=Max("end_time"))["latest"]
+        version = latest.isoformat() if latest else "none"
+        cache.set(key, version, settings.GRAPHQL_RESPONSE_CACHE_VERSION_TIMEOUT)
+    return version
+
+
+def _last_scraped_key(jurisdiction_id):
+    return "lastscraped~" + jurisdiction_id
+
+
+def last_scraped(jurisdiction_ids):
+    """
+    get the end time of the latest successful scrape for each jurisdiction id
+
+    times are cached until a run of the jurisdiction is saved, runs recorded by
+    another process are picked up when the cached time expires
+    """
+    cache = caches["default"]
+    cached = cache.get_many([_last_scraped_key(j) for j in jurisdiction_ids])
+    times = {
+        j: cached[_last_scraped_key(j)]
+        for j in jurisdiction_ids
+        if _last_scraped_key(j) in cached
+    }
+    missing = [j for j in jurisdiction_ids if j not in times]
+    if missing:
+        latest = dict(
+            RunPlan.objects.filter(success=True, jurisdiction_id__in=missing)
+            .values("jurisdiction_id")
+            .annotate(latest=Max("end_time"))
+            .values_list("jurisdiction_id", "latest")
+        )
+        fetched = {j: latest.get(j) for j in missing}
+        cache.set_many(
+            {_last_scraped_key(j): time for j, time in fetched.items()},
+            settings.GRAPHQL_RESPONSE_CACHE_VERSION_TIMEOUT,
+        )
+        times.update(fetched)
+    return times
+
+
+def invalidate_last_scraped(sender, instance, **kwargs):
+    caches["default"].delete(_last_scraped_key(instance.jurisdiction_id))
+
+
+def response_cache_key(document, operation_name, variables, tier, batch_id=None):
+    """
+    build the cache key for a complete GraphQL response
+
+    keyed on the normalized document, operation, variables, API tier, and the
+    data version of the jurisdictions the query touches, operations in a batch
+    are keyed on their id too, since their responses include it
+    """
+    jurisdictions = get_jurisdictions(document.document_ast, operation_name, variables)
+    parts = [
+        document.normalized_hash,
+        operation_name or "",
+        json.dumps(variables or {}, sort_keys=True, default=str),
+        tier or "",
+        data_version(jurisdictions),
+    ]
+    if batch_id is not None:
+        parts.append("batch:" + json.dumps(batch_id, default=str))
+    return "gqlresp~" + document_hash("~".join(parts))
+
+
+# pagination arguments don't change which rows a connection's result set is built from
+PAGINATION_ARGUMENTS = ("first", "last", "before", "after")
+
+
+def _result_sets(schema):
+    """root fields declared as result_sets on the query type (or its bases)"""
+    result_sets = {}
+    for cls in reversed(schema.get_query_type().graphene_type.__mro__):
+        result_sets.update(cls.__dict__.get("result_sets", {}))
+    return result_sets
+
+
+def response_etag(document, operation_name, variables, tier):
+    """
+    build a weak ETag for a GraphQL response, and its last modified time, if known
+
+    the results of root fields declared as result_sets are versioned by their latest
+    updated_at & count, any other fields by the data version of their jurisdictions,
+    either way without executing the query
+
+    returns (None, None) if the operation can't be versioned
+    """
+    operation = _get_operation(document.document_ast, operation_name)
+    if operation is None:
+        return None, None
+    query_type = document.schema.get_query_type()
+    result_sets = _result_sets(document.schema)
+
+    versions = []
+    latest = []
+    unversioned = False
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, Field):
+            return None, None
+        filter_results = result_sets.get(selection.name.value)
+        if filter_results is None:
+            unversioned = True
+            continue
+        arguments = get_argument_values(
+            query_type.fields[selection.name.value].args,
+            selection.arguments,
+            variables,
+        )
+        for name in PAGINATION_ARGUMENTS:
+            arguments.pop(name, None)
+        updated_at, count = queryset_version(filter_results(**arguments))
+        versions.append(f"{updated_at}:{count}")
+        latest.append(updated_at)
+
+    # the last modified time is only known if every root field was versioned
+    last_modified = None
+    if unversioned:
+        jurisdictions = get_jurisdictions(
+            document.document_ast, operation_name, variables
+        )
+        versions.append(data_version(jurisdictions))
+    elif latest and None not in latest:
+        last_modified = max(latest)
+
+    etag = weak_etag(
+        document.normalized_hash,
+        operation_name or "",
+        json.dumps(variables or {}, sort_keys=True, default=str),
+        tier or "",
+        *versions,
+    )
+    return etag, last_modified
+
+
+# requests currently being executed by this process, by response cache key
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+# how often (in seconds) to check for a result shared by another process
+FLIGHT_POLL_INTERVAL = 0.05
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+def _shared_flight(key, fn, timeout):
+    """
+    run fn once across processes, using a short-lived lock in the shared cache
+
+    the process holding the lock shares its result under a key unique to this
+    flight, so waiting requests never get a result from an earlier flight
+    """
+    cache = caches["default"]
+    lock_key = "gqllock~" + key
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, timeout):
+        try:
+            result, share = fn()
+            if share:
+                cache.set(f"gqlflight~{key}~{token}", result, timeout)
+            return result, share
+        finally:
+            cache.delete(lock_key)
+
+    token = cache.get(lock_key)
+    deadline = time.monotonic() + timeout
+    while token and time.monotonic() < deadline:
+        # the lock is checked first, a flight shares its result before releasing it
+        finished = cache.get(lock_key) != token
+        result = cache.get(f"gqlflight~{key}~{token}")
+        if result is not None:
+            return result, True
+        if finished:
+            # the flight finished without a result to share
+            break
+        time.sleep(FLIGHT_POLL_INTERVAL)
+    return fn()
+
+
+def single_flight(key, fn, timeout):
+    """
+    coalesce identical concurrent requests, so only the first one executes
+
+    fn returns (result, share), concurrent callers with the same key wait up to
+    timeout seconds for the first caller's result if share is True, & run fn
+    themselves otherwise, within a process callers wait on the first caller's
+    thread, across processes on the shared cache
+
+    returns (result, share) like fn
+    """
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        first = flight is None
+        if first:
+            flight = _in_flight[key] = _Flight()
+
+    if not first:
+        if flight.done.wait(timeout) and flight.result is not None:
+            return flight.result, True
+        return fn()
+
+    try:
+        result, share = _shared_flight(key, fn, timeout)
+        if share:
+            flight.result = result
+        return result, share
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+        flight.done.set()
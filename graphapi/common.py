@@ -1,6 +1,20 @@
+import json
 import graphene
 from collections import Iterable
-from graphql_relay.connection.arrayconnection import connection_from_list_slice
+from functools import partial
+from django.db.models import Q
+from promise import is_thenable, Promise
+from graphql_relay.connection.arrayconnection import (
+    connection_from_list_slice,
+    cursor_to_offset,
+    get_offset_with_default,
+    offset_to_cursor,
+)
+from graphql_relay.utils import base64, unbase64
+
+KEYSET_PREFIX = "keyset:"
+# maximum number of ids that can be looked up at once by the *_by_id & nodes fields
+MAX_IDS = 500
 
 
 class OCDBaseNode(graphene.ObjectType):
@@ -27,7 +41,238 @@ class NameNode(graphene.ObjectType):
     end_date = graphene.String()
 
 
+def check_ids(ids):
+    if len(ids) > MAX_IDS:
+        raise ValueError(f"can look up at most {MAX_IDS} ids at once")
+
+
+def resolve_ids(queryset, ids):
+    """
+    fetch the objects with the given ids in a single query
+
+    results are returned in the order of ids, with None for ids that weren't found
+    """
+    check_ids(ids)
+    found = {obj.pk: obj for obj in queryset.filter(pk__in=set(ids))}
+    return [found.get(id) for id in ids]
+
+
+def _keyset_ordering(queryset):
+    """
+    get the ordering of a queryset as plain field names, with the pk as tie-breaker
+
+    returns None if the ordering can't be used for keyset pagination (expressions,
+    related fields, etc.)
+    """
+    opts = queryset.model._meta
+    ordering = []
+    for name in queryset.query.order_by or opts.ordering:
+        if not isinstance(name, str) or "__" in name or name.lstrip("-") == "?":
+            return None
+        desc = name.startswith("-")
+        name = name.lstrip("-")
+        if name == "pk":
+            name = opts.pk.name
+        try:
+            opts.get_field(name)
+        except Exception:
+            return None
+        ordering.append(("-" if desc else "") + name)
+
+    if opts.pk.name not in [name.lstrip("-") for name in ordering]:
+        desc = ordering[-1].startswith("-") if ordering else False
+        ordering.append(("-" if desc else "") + opts.pk.name)
+    return ordering
+
+
+def keyset_to_cursor(obj, ordering):
+    values = []
+    for name in ordering:
+        field = obj._meta.get_field(name.lstrip("-"))
+        # NULLs are kept as null, value_to_string would turn them into ""
+        if field.value_from_object(obj) is None:
+            values.append(None)
+        else:
+            values.append(field.value_to_string(obj))
+    return base64(KEYSET_PREFIX + json.dumps(values))
+
+
+def _is_keyset_cursor(cursor):
+    try:
+        return unbase64(cursor).startswith(KEYSET_PREFIX)
+    except Exception:
+        return False
+
+
+def cursor_to_keyset(cursor, model, ordering):
+    """decode a keyset cursor, returns None if cursor isn't a keyset cursor"""
+    if not _is_keyset_cursor(cursor):
+        return None
+    cursor = unbase64(cursor)
+    try:
+        values = json.loads(cursor[len(KEYSET_PREFIX) :])
+    except ValueError:
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError("cursor does not match the ordering of this connection")
+    return [
+        None
+        if value is None
+        else model._meta.get_field(name.lstrip("-")).to_python(value)
+        for name, value in zip(ordering, values)
+    ]
+
+
+def check_offset_cursors(args):
+    """
+    reject after/before cursors that aren't offset cursors
+
+    a keyset cursor doesn't decode as an offset, without this it would silently
+    restart paging at the first row
+    """
+    for name in ("after", "before"):
+        cursor = args.get(name)
+        if cursor and cursor_to_offset(cursor) is None:
+            if not args.get("keyset") and _is_keyset_cursor(cursor):
+                raise ValueError(
+                    f"invalid cursor for '{name}', keyset cursors need keyset: true"
+                )
+            raise ValueError(f"invalid cursor for '{name}'")
+
+
+def _seek_filter(ordering, values):
+    """
+    build a filter selecting rows that sort after values in ordering
+
+    NULLs sort last ascending & first descending (PostgreSQL's default), comparisons
+    never match them, so they're selected with explicit isnull lookups
+    """
+    seek = Q()
+    equal = Q()
+    for name, value in zip(ordering, values):
+        field = name.lstrip("-")
+        desc = name.startswith("-")
+        if value is None:
+            # only non-NULLs follow a NULL, and only when descending
+            after = Q(**{f"{field}__isnull": False}) if desc else None
+            same = Q(**{f"{field}__isnull": True})
+        else:
+            after = Q(**{f"{field}__{'lt' if desc else 'gt'}": value})
+            if not desc:
+                after |= Q(**{f"{field}__isnull": True})
+            same = Q(**{field: value})
+        if after is not None:
+            seek |= equal & after
+        equal &= same
+    return seek
+
+
 class DjangoConnectionField(graphene.relay.ConnectionField):
+    def __init__(self, type, *args, **kwargs):
+        # connections that support keyset pagination let clients opt in to it, offset
+        # cursors stay the default
+        if getattr(type, "keyset_pagination", False):
+            kwargs.setdefault(
+                "keyset",
+                graphene.Boolean(
+                    description="page with cursors that seek past the last row, "
+                    "for fast deep pages, only with first & after"
+                ),
+            )
+        super().__init__(type, *args, **kwargs)
+
+    @classmethod
+    def connection_resolver(
+        cls, resolver, connection_type, root, info, keyset=False, **args
+    ):
+        # keyset is handled by the connection, not passed on to resolvers
+        resolved = resolver(root, info, **args)
+        args["keyset"] = keyset
+        if is_thenable(resolved):
+            return Promise.resolve(resolved).then(
+                partial(cls.resolve_connection, connection_type, args)
+            )
+        return cls.resolve_connection(connection_type, args, resolved)
+
+    @classmethod
+    def resolve_keyset_connection(cls, connection_type, args, resolved):
+        """
+        resolve a forward-paging connection by seeking past the sort key in the cursor
+
+        unlike OFFSET pagination the cost of a page doesn't grow with its depth,
+        returns None if this request can't be handled with keyset pagination
+        """
+        first = args.get("first")
+        after = args.get("after")
+        if not first or args.get("last") or args.get("before"):
+            return None
+
+        ordering = _keyset_ordering(resolved)
+        if not ordering:
+            return None
+
+        qs = resolved.order_by(*ordering)
+        if after:
+            values = cursor_to_keyset(after, resolved.model, ordering)
+            if values is None:
+                # offset cursor from before keyset pagination, let the slicing code
+                # handle it (or reject it if it isn't one)
+                return None
+            qs = qs.filter(_seek_filter(ordering, values))
+
+        # fetch an extra row to know if there's a next page
+        rows = list(qs[: first + 1])
+        has_next_page = len(rows) > first
+        rows = rows[:first]
+
+        edges = [
+            connection_type.Edge(node=row, cursor=keyset_to_cursor(row, ordering))
+            for row in rows
+        ]
+        page_info = graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            # like offset cursors, paging forward never reports a previous page
+            has_previous_page=False,
+            has_next_page=has_next_page,
+        )
+        return connection_type(edges=edges, page_info=page_info)
+
+    @classmethod
+    def resolve_forward_connection(cls, connection_type, args, resolved):
+        """
+        resolve a first/after page of a QuerySet without counting the whole set
+
+        an extra row is fetched to determine hasNextPage, totalCount is computed
+        lazily by CountableConnectionBase only if it is requested
+        """
+        check_offset_cursors(args)
+        first = args.get("first")
+        start = get_offset_with_default(args.get("after"), -1) + 1
+
+        if first is not None:
+            rows = list(resolved[start : start + first + 1])
+            has_next_page = len(rows) > first
+            rows = rows[:first]
+        else:
+            rows = list(resolved[start:])
+            has_next_page = False
+
+        edges = [
+            connection_type.Edge(node=row, cursor=offset_to_cursor(start + i))
+            for i, row in enumerate(rows)
+        ]
+        page_info = graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=False,
+            has_next_page=has_next_page,
+        )
+        connection = connection_type(edges=edges, page_info=page_info)
+        # without a first or after parameter every row was fetched
+        connection._len = None if first is not None or start else len(rows)
+        return connection
+
     @classmethod
     def resolve_connection(cls, connection_type, args, resolved):
         if isinstance(resolved, connection_type):
@@ -48,12 +293,31 @@ class DjangoConnectionField(graphene.relay.ConnectionField):
                     )
                 )
 
+        if args.get("keyset") and (args.get("last") or args.get("before")):
+            raise ValueError("keyset pagination only supports 'first' and 'after'")
+
         if isinstance(resolved, list):
             _len = len(resolved)
-        else:
-            # Django QuerySet
+        elif args.get("last") or args.get("before"):
+            # Django QuerySet, paging from the end requires knowing the length
             _len = resolved.count()
+        else:
+            # Django QuerySet, paging forward only needs first + 1 rows
+            connection = None
+            if args.get("keyset"):
+                connection = cls.resolve_keyset_connection(
+                    connection_type, args, resolved
+                )
+                if connection is not None:
+                    connection._len = None
+            if connection is None:
+                connection = cls.resolve_forward_connection(
+                    connection_type, args, resolved
+                )
+            connection.iterable = resolved
+            return connection
 
+        check_offset_cursors(args)
         connection = connection_from_list_slice(
             list_slice=resolved,
             args=args,
@@ -76,7 +340,8 @@ class CountableConnectionBase(graphene.relay.Connection):
     total_count = graphene.Int()
 
     def resolve_total_count(self, info):
-        count = getattr(self, "_len")
+        # connections only count their rows when totalCount is requested
+        count = getattr(self, "_len", None)
         if count is None:
             count = self.iterable.count()
         return count
@@ -1,15 +1,15 @@
 import datetime
 import graphene
-from django.db.models import Q, Prefetch
+from promise import Promise
+from django.db.models import Exists, OuterRef, Q
 from openstates.data.models import (
     Jurisdiction,
+    Membership,
     Organization,
     Person,
-    Membership,
-    LegislativeSession,
-    RunPlan,
 )
 from utils.geo import coords_to_divisions
+from utils.people import search_people
 from .common import (
     OCDBaseNode,
     IdentifierNode,
@@ -17,8 +17,10 @@ from .common import (
     LinkNode,
     DjangoConnectionField,
     CountableConnectionBase,
+    resolve_ids,
 )
-from .optimization import optimize
+from .loaders import load_last_scraped, load_related
+from .optimization import optimize, Relation
 
 
 def _resolve_suborganizations(root_obj, field_name, classification=None):
@@ -51,9 +53,7 @@ def _resolve_suborganizations(root_obj, field_name, classification=None):
     return qs
 
 
-def _membership_filter(
-    qs, info, classification=None, prefix=None, current=False, coming_from_person=True
-):
+def _membership_filter(qs, classification=None, current=False):
     today = datetime.date.today().isoformat()
     if current:
         qs = qs.filter(
@@ -66,16 +66,43 @@ def _membership_filter(
         )
     if classification:
         qs = qs.filter(organization__classification__in=classification)
+    return qs
 
-    related = [".post", ".post.division"]
-    if coming_from_person:
-        related.append(".organization")
-    else:
-        related.append(".person")
 
-    # if we're getting a membership we're probably going to need org/post
-    qs = optimize(qs, info, None, related, prefix=prefix)
-    return qs
+def _has_membership(*filters, current=True, **lookups):
+    """
+    filter people that have a (current) membership matching filters
+
+    a correlated EXISTS instead of a join, so people with several matching
+    memberships are only returned once
+    """
+    memberships = Membership.objects.filter(
+        *filters, person_id=OuterRef("pk"), **lookups
+    )
+    if current:
+        memberships = _membership_filter(memberships, current=True)
+    return Exists(memberships)
+
+
+def _member_of(organization, current=True, post=None):
+    if organization.startswith("ocd-organization/"):
+        filters = Q(organization_id=organization)
+    else:
+        filters = Q(organization__name=organization)
+    if post:
+        filters &= Q(post__label=post)
+    return _has_membership(filters, current=current)
+
+
+def _person_memberships(current):
+    # prefetched memberships are filtered by organization classification in python
+    return Relation(
+        "memberships",
+        queryset=lambda qs: _membership_filter(qs, current=current).select_related(
+            "organization"
+        ),
+        to_attr="current_memberships" if current else "old_memberships",
+    )
 
 
 class OfficeNode(graphene.ObjectType):
@@ -115,6 +142,30 @@ class OrganizationNode(OCDBaseNode):
     links = graphene.List(LinkNode)
     sources = graphene.List(LinkNode)
 
+    model = Organization
+    # fields that aren't loaded from the model relation of the same name
+    relations = {
+        "current_memberships": Relation(
+            "memberships",
+            queryset=lambda qs: _membership_filter(qs, current=True),
+            to_attr="current_memberships",
+        ),
+        # prefetched children are filtered by classification in python
+        "children": Relation("children", columns=("classification",), bounded=True),
+        # not stored for organizations
+        "identifiers": None,
+    }
+
+    # estimated rows per organization for unpaginated lists, used for query cost
+    estimated_rows = {
+        "children": 5,
+        "current_memberships": 60,
+        "identifiers": 2,
+        "other_names": 2,
+        "links": 2,
+        "sources": 2,
+    }
+
     def resolve_children(
         self, info, classification=None, first=None, last=None, before=None, after=None
     ):
@@ -124,9 +175,7 @@ class OrganizationNode(OCDBaseNode):
         if hasattr(self, "current_memberships"):
             return self.current_memberships
         else:
-            return _membership_filter(
-                self.memberships, info, None, current=True, coming_from_person=False
-            )
+            return optimize(_membership_filter(self.memberships, current=True), info)
 
 
 class DivisionNode(OCDBaseNode):
@@ -175,36 +224,62 @@ class PersonNode(OCDBaseNode):
     )
     votes = DjangoConnectionField("graphapi.legislative.BillVoteConnection")
 
+    model = Person
+    # fields that aren't loaded from the model relation of the same name
+    relations = {
+        "contact_details": "offices",
+        "current_memberships": _person_memberships(current=True),
+        "old_memberships": _person_memberships(current=False),
+    }
+    # columns read by computed fields
+    columns = {"contact_details": ("email",)}
+
+    # estimated rows per person for unpaginated lists, used for query cost
+    estimated_rows = {
+        "identifiers": 2,
+        "other_names": 2,
+        "links": 2,
+        "sources": 2,
+        "contact_details": 4,
+        "offices": 2,
+        "current_memberships": 3,
+        "old_memberships": 5,
+        "votes": 1000,
+    }
+
     def resolve_identifiers(self, info):
-        return self.identifiers.all()
+        return load_related(self, info, "identifiers")
 
     def resolve_other_names(self, info):
-        return self.other_names.all()
+        return load_related(self, info, "other_names")
 
     def resolve_links(self, info):
-        return self.links.all()
+        return load_related(self, info, "links")
 
     def resolve_sources(self, info):
-        return self.sources.all()
+        return load_related(self, info, "sources")
 
     def resolve_contact_details(self, info):
-        contact_details = []
-        # contact detail shim for backwards compatibility
-        for office in self.offices.all():
-            for key in ("fax", "voice", "address"):
-                if value := getattr(office, key):
-                    contact_details.append(
-                        dict(value=value, type=key, note=office.display_name)
-                    )
-        # email shim for backwards compatibility
-        if self.email:
-            contact_details.append(
-                dict(value=self.email, type="email", note="Capitol Office")
-            )
-        return contact_details
+        def _shim(offices):
+            contact_details = []
+            # contact detail shim for backwards compatibility
+            for office in offices:
+                for key in ("fax", "voice", "address"):
+                    if value := getattr(office, key):
+                        contact_details.append(
+                            dict(value=value, type=key, note=office.display_name)
+                        )
+            # email shim for backwards compatibility
+            if self.email:
+                contact_details.append(
+                    dict(value=self.email, type="email", note="Capitol Office")
+                )
+            return contact_details
+
+        return Promise.resolve(load_related(self, info, "offices")).then(_shim)
 
     def resolve_offices(self, info):
-        return self.offices.all()
+        return load_related(self, info, "offices")
 
     def resolve_current_memberships(self, info, classification=None):
         if hasattr(self, "current_memberships"):
@@ -216,8 +291,9 @@ class PersonNode(OCDBaseNode):
                 ]
             return self.current_memberships
         else:
-            return _membership_filter(
-                self.memberships, info, classification, current=True
+            return optimize(
+                _membership_filter(self.memberships, classification, current=True),
+                info,
             )
 
     def resolve_old_memberships(self, info, classification=None):
@@ -230,12 +306,14 @@ class PersonNode(OCDBaseNode):
                 ]
             return self.old_memberships
         else:
-            return _membership_filter(
-                self.memberships, info, classification, current=False
+            return optimize(
+                _membership_filter(self.memberships, classification, current=False),
+                info,
             )
 
-    def resolve_votes(self, info):
-        return self.votes.all()
+    def resolve_votes(self, info, first=None, last=None, before=None, after=None):
+        # a person can have thousands of votes, the connection pages them with LIMIT
+        return optimize(self.votes.all(), info)
 
 
 class MembershipNode(OCDBaseNode):
@@ -284,6 +362,21 @@ class JurisdictionNode(graphene.ObjectType):
         OrganizationConnection, classification=graphene.List(graphene.String)
     )
 
+    model = Jurisdiction
+    # fields that aren't loaded from the model relation of the same name
+    relations = {
+        "legislative_sessions": Relation(
+            "legislative_sessions", queryset=lambda qs: qs.order_by("start_date")
+        ),
+        # prefetched organizations are filtered by classification in python
+        "organizations": Relation("organizations", columns=("classification",)),
+    }
+    # columns read by computed fields
+    columns = {"last_scraped_at": ()}
+
+    # estimated rows per jurisdiction for unpaginated lists, used for query cost
+    estimated_rows = {"legislative_sessions": 20, "organizations": 10}
+
     def resolve_legislative_sessions(
         self, info, first=None, last=None, before=None, after=None
     ):
@@ -295,10 +388,7 @@ class JurisdictionNode(graphene.ObjectType):
         return _resolve_suborganizations(self, "organizations", classification)
 
     def resolve_last_scraped_at(self, info):
-        try:
-            return self.runs.filter(success=True).latest("end_time").end_time
-        except RunPlan.DoesNotExist:
-            return None
+        return load_last_scraped(self, info)
 
 
 class JurisdictionConnection(graphene.relay.Connection):
@@ -311,6 +401,9 @@ class PersonConnection(CountableConnectionBase):
         node = PersonNode
 
     max_items = 100
+    # with keyset: true, cursors encode the sort key so deep pages are fetched with a
+    # WHERE seek
+    keyset_pagination = True
 
 
 class CoreQuery:
@@ -332,8 +425,14 @@ class CoreQuery:
         longitude=graphene.Float(),
     )
     person = graphene.Field(PersonNode, id=graphene.ID())
+    people_by_id = graphene.List(
+        PersonNode, ids=graphene.List(graphene.NonNull(graphene.ID), required=True)
+    )
     organization = graphene.Field(OrganizationNode, id=graphene.ID())
 
+    # estimated rows for unpaginated root lists, used for query cost
+    estimated_rows = {"jurisdictions": 52}
+
     def resolve_jurisdictions(
         self,
         info,
@@ -344,27 +443,14 @@ class CoreQuery:
         after=None,
     ):
         qs = Jurisdiction.objects.filter(classification=classification).order_by("name")
-        return optimize(
-            qs,
-            info,
-            [
-                (
-                    ".legislativeSessions",
-                    Prefetch(
-                        "legislative_sessions",
-                        LegislativeSession.objects.all().order_by("start_date"),
-                    ),
-                ),
-                ".organizations",
-                ".organizations.children",
-            ],
-        )
+        return optimize(qs, info)
 
     def resolve_jurisdiction(self, info, id=None, name=None):
+        qs = optimize(Jurisdiction.objects.all(), info)
         if id:
-            return Jurisdiction.objects.get(id=id)
+            return qs.get(id=id)
         if name:
-            return Jurisdiction.objects.get(name=name)
+            return qs.get(name=name)
         else:
             raise ValueError("Jurisdiction requires id or name")
 
@@ -385,21 +471,15 @@ class CoreQuery:
         longitude=None,
     ):
         qs = Person.objects.all()
-        today = datetime.date.today()
 
         if name:
-            qs = qs.filter(
-                Q(name__icontains=name) | Q(other_names__name__icontains=name)
-            )
+            qs = search_people(name, people=qs)
         if division_id:
-            qs = qs.filter(
-                Q(memberships__post__division_id=division_id),
-                Q(memberships__end_date="") | Q(memberships__end_date__gt=today),
-            )
+            qs = qs.filter(_has_membership(post__division_id=division_id))
         if member_of:
-            qs = qs.member_of(member_of, post=district)
+            qs = qs.filter(_member_of(member_of, post=district))
         if ever_member_of:
-            qs = qs.member_of(ever_member_of, current_only=False, post=district)
+            qs = qs.filter(_member_of(ever_member_of, current=False, post=district))
         if updated_since:
             qs = qs.filter(updated_at__gte=updated_since)
         if district and not (member_of or ever_member_of):
@@ -416,57 +496,18 @@ class CoreQuery:
                 raise ValueError("invalid lat or lon")
 
             divisions = coords_to_divisions(latitude, longitude)
-            qs = qs.filter(
-                Q(memberships__post__division__id__in=divisions),
-                Q(memberships__end_date="") | Q(memberships__end_date__gt=today),
-            )
+            qs = qs.filter(_has_membership(post__division_id__in=divisions))
 
         elif latitude or longitude:
             raise ValueError("must provide lat & lon together")
 
-        qs = optimize(
-            qs,
-            info,
-            [
-                ".identifiers",
-                ".otherNames",
-                ".links",
-                ".sources",
-                ".offices",
-                (".contactDetails", Prefetch("offices")),
-                (
-                    ".currentMemberships",
-                    Prefetch(
-                        "memberships",
-                        queryset=_membership_filter(
-                            Membership.objects,
-                            info,
-                            prefix=".currentMemberships",
-                            current=True,
-                        ),
-                        to_attr="current_memberships",
-                    ),
-                ),
-                (
-                    ".oldMemberships",
-                    Prefetch(
-                        "memberships",
-                        queryset=_membership_filter(
-                            Membership.objects,
-                            info,
-                            prefix=".oldMemberships",
-                            current=False,
-                        ),
-                        to_attr="old_memberships",
-                    ),
-                ),
-            ],
-        )
-
-        return qs
+        return optimize(qs, info)
 
     def resolve_person(self, info, id):
-        return Person.objects.get(pk=id)
+        return optimize(Person.objects.all(), info).get(pk=id)
+
+    def resolve_people_by_id(self, info, ids):
+        return resolve_ids(optimize(Person.objects.all(), info), ids)
 
     def resolve_organization(self, info, id):
-        return optimize(Organization.objects, info, None, [".parent"]).get(pk=id)
+        return optimize(Organization.objects.all(), info).get(pk=id)
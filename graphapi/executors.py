@@ -0,0 +1,111 @@
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db import close_old_connections, connections
+from graphql.execution.executors.utils import process
+from promise import Promise
+
+# root fields of every request are resolved in one pool per process, so the number
+# of threads (& database connections) doesn't grow with the number of requests
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None:
+            _pool_size = settings.GRAPHQL_ROOT_FIELD_THREADS
+            _pool = ThreadPoolExecutor(_pool_size, thread_name_prefix="graphql")
+        return _pool
+
+
+def shutdown_pool():
+    """stop the pool's threads, each closes its database connections first"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+
+    # every worker blocks on the barrier, so each one runs exactly one close
+    barrier = threading.Barrier(_pool_size)
+
+    def close():
+        barrier.wait()
+        connections.close_all()
+
+    for _ in range(_pool_size):
+        pool.submit(close)
+    pool.shutdown(wait=True)
+
+
+def _in_pool_thread(fn, budget=None):
+    # pool threads keep their connections between fields, like request threads they
+    # only close the ones past CONN_MAX_AGE (or broken) before & after each field
+    def wrapped(*args, **kwargs):
+        close_old_connections()
+        try:
+            # the request's SQL budget covers the queries of every thread
+            with budget.guard() if budget else contextlib.nullcontext():
+                return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return wrapped
+
+
+class ConcurrentRootExecutor(object):
+    """
+    GraphQL executor that resolves independent root fields in parallel threads
+
+    root fields are resolved in a process-wide pool of GRAPHQL_ROOT_FIELD_THREADS
+    threads, at most max_fanout at once per request, the rest in the request's own
+    thread, nested fields are resolved without new threads, operations with a
+    single root field & profiled requests are executed exactly as with the default
+    executor
+    """
+
+    def __init__(self, max_fanout=4):
+        self.max_fanout = max_fanout
+        # executors are shared by requests, each request only waits on its own fields
+        self._local = threading.local()
+
+    @property
+    def futures(self):
+        if not hasattr(self._local, "futures"):
+            self._local.futures = []
+        return self._local.futures
+
+    def wait_until_finished(self):
+        while self.futures:
+            futures = list(self.futures)
+            del self.futures[:]
+            wait(futures)
+
+    def _is_concurrent(self, info):
+        if info.parent_type is not info.schema.get_query_type():
+            return False
+        if getattr(info.context, "graphql_profile", None) is not None:
+            return False
+        return len(info.operation.selection_set.selections) > 1
+
+    def execute(self, fn, *args, **kwargs):
+        info = args[1] if len(args) > 1 else None
+        if info is None or not self._is_concurrent(info):
+            return fn(*args, **kwargs)
+        if len(self.futures) >= self.max_fanout:
+            return fn(*args, **kwargs)
+
+        promise = Promise()
+        # the whole of process runs in the wrapper, resolving the promise completes
+        # the field's nested values, whose queries must use the thread's connection
+        # (& budget) too
+        budget = getattr(info.context, "graphql_budget", None)
+        future = get_pool().submit(
+            _in_pool_thread(process, budget), promise, fn, args, kwargs
+        )
+        self.futures.append(future)
+        return promise
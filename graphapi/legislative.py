@@ -1,20 +1,33 @@
 import graphene
 import re
-from django.db.models import Prefetch
-from openstates.data.models import Bill, BillActionRelatedEntity, PersonVote
+from openstates.data.models import (
+    Bill,
+    Jurisdiction,
+    Organization,
+    Person,
+    VoteEvent,
+)
 from openstates.utils.transformers import fix_bill_id
-from .common import OCDBaseNode, DjangoConnectionField, CountableConnectionBase
+from .common import (
+    OCDBaseNode,
+    DjangoConnectionField,
+    CountableConnectionBase,
+    check_ids,
+    resolve_ids,
+)
 from .core import (
+    JurisdictionNode,
     LegislativeSessionNode,
     OrganizationNode,
     IdentifierNode,
     PersonNode,
     LinkNode,
 )
-from .optimization import optimize
+from .loaders import load_related
+from .optimization import optimize, Relation
 from urllib.parse import urlparse
 from utils.common import abbr_to_jid
-from utils.bills import search_bills
+from utils.bills import has_sponsorship, search_bills
 
 
 def jurisdiction_query(jurisdiction):
@@ -26,6 +39,51 @@ def jurisdiction_query(jurisdiction):
     return query
 
 
+def filter_bills(
+    jurisdiction=None,
+    chamber=None,
+    session=None,
+    updated_since=None,
+    classification=None,
+    subject=None,
+    sponsor=None,
+    action_since=None,
+    search_query=None,
+):
+    """the bills matching the arguments of the bills field, without pagination"""
+    # q (full text)
+    bills = Bill.objects.all()
+
+    if jurisdiction:
+        bills = bills.filter(**jurisdiction_query(jurisdiction))
+    subjects = [subject] if subject else []
+    bills = search_bills(
+        bills=bills,
+        query=search_query,
+        chamber=chamber,
+        session=session,
+        classification=classification,
+        subjects=subjects,
+        sort="-updated",
+    )
+    if updated_since:
+        bills = bills.filter(updated_at__gte=updated_since)
+    if action_since:
+        bills = bills.filter(latest_action_date__gte=action_since)
+    if sponsor:
+        sponsor_args = {}
+        if "primary" in sponsor:
+            sponsor_args["primary"] = sponsor["primary"]
+        if sponsor.get("person"):
+            sponsor_args["person_id"] = sponsor["person"]
+        elif sponsor.get("name"):
+            sponsor_args["name"] = sponsor["name"]
+        if sponsor_args:
+            bills = bills.filter(has_sponsorship(**sponsor_args))
+
+    return bills
+
+
 class BillAbstractNode(graphene.ObjectType):
     abstract = graphene.String()
     note = graphene.String()
@@ -72,11 +130,12 @@ class BillActionNode(graphene.ObjectType):
 
     related_entities = graphene.List(RelatedEntityNode)
 
+    # estimated rows per action for unpaginated lists, used for query cost
+    estimated_rows = {"related_entities": 2}
+
     def resolve_related_entities(self, info):
         if "related_entities" not in getattr(self, "_prefetched_objects_cache", []):
-            return optimize(
-                self.related_entities.all(), info, None, ["organization", "person"]
-            )
+            return optimize(self.related_entities.all(), info)
         else:
             return self.related_entities.all()
 
@@ -92,8 +151,11 @@ class BillDocumentNode(graphene.ObjectType):
     date = graphene.String()
     links = graphene.List(MimetypeLinkNode)
 
+    # estimated rows per document for unpaginated lists, used for query cost
+    estimated_rows = {"links": 2}
+
     def resolve_links(self, info):
-        return self.links.all()
+        return load_related(self, info, "links")
 
 
 class BillNode(OCDBaseNode):
@@ -119,75 +181,72 @@ class BillNode(OCDBaseNode):
     # extra fields
     openstates_url = graphene.String()
 
+    model = Bill
+    # fields that aren't loaded from the model relation of the same name
+    relations = {
+        "openstates_url": "legislative_session",
+        # bills have a handful of votes, so they're prefetched for a page of bills
+        "votes": Relation("votes", bounded=True),
+    }
+    # columns read by computed fields
+    columns = {"openstates_url": ("identifier",)}
+
+    # estimated rows per bill for unpaginated lists, used for query cost
+    estimated_rows = {
+        "abstracts": 1,
+        "other_titles": 2,
+        "other_identifiers": 2,
+        "actions": 20,
+        "sponsorships": 10,
+        "related_bills": 2,
+        "documents": 5,
+        "versions": 5,
+        "sources": 2,
+        "votes": 5,
+    }
+
     def resolve_abstracts(self, info):
-        return self.abstracts.all()
+        return load_related(self, info, "abstracts")
 
     def resolve_other_titles(self, info):
-        return self.other_titles.all()
+        return load_related(self, info, "other_titles")
 
     def resolve_other_identifiers(self, info):
-        return self.other_identifiers.all()
+        return load_related(self, info, "other_identifiers")
 
     def resolve_actions(self, info):
         if "actions" not in getattr(self, "_prefetched_objects_cache", []):
-            return optimize(
-                self.actions.all(),
-                info,
-                [
-                    (
-                        ".relatedEntities",
-                        Prefetch(
-                            "related_entities",
-                            BillActionRelatedEntity.objects.all().select_related(
-                                "organization", "person"
-                            ),
-                        ),
-                    )
-                ],
-                [".organization", ".vote"],
-            )
+            return optimize(self.actions.all(), info)
         else:
             return self.actions.all()
 
     def resolve_sponsorships(self, info):
-        return self.sponsorships.all()
+        return load_related(self, info, "sponsorships")
 
     def resolve_documents(self, info):
         if "documents" not in getattr(self, "_prefetched_objects_cache", []):
-            return optimize(self.documents.all(), info, [".links"])
+            return optimize(self.documents.all(), info)
         else:
             return self.documents.all()
 
     def resolve_versions(self, info):
         if "versions" not in getattr(self, "_prefetched_objects_cache", []):
-            return optimize(self.versions.all(), info, [".links"])
+            return optimize(self.versions.all(), info)
         else:
             return self.versions.all()
 
     def resolve_sources(self, info):
-        return self.sources.all()
+        return load_related(self, info, "sources")
 
     def resolve_votes(self, info, first=None, last=None, before=None, after=None):
         if "votes" not in getattr(self, "_prefetched_objects_cache", []):
-            return optimize(
-                self.votes.all(),
-                info,
-                [
-                    ".counts",
-                    (
-                        ".votes",
-                        Prefetch(
-                            "votes", PersonVote.objects.all().select_related("voter")
-                        ),
-                    ),
-                ],
-            )
+            return optimize(self.votes.all(), info)
         else:
             return self.votes.all()
 
     def resolve_related_bills(self, info):
         if "related_bills" not in getattr(self, "_prefetched_objects_cache", []):
-            return optimize(self.related_bills.all(), info, None, [".relatedBill"])
+            return optimize(self.related_bills.all(), info)
         else:
             return self.related_bills.all()
 
@@ -203,6 +262,9 @@ class BillConnection(CountableConnectionBase):
         node = BillNode
 
     max_items = 100
+    # with keyset: true, cursors encode the sort key so deep pages are fetched with a
+    # WHERE seek
+    keyset_pagination = True
 
 
 class VoteCountNode(graphene.ObjectType):
@@ -245,14 +307,17 @@ class VoteEventNode(OCDBaseNode):
     counts = graphene.List(VoteCountNode)
     sources = graphene.List(LinkNode)
 
+    # estimated rows per vote event for unpaginated lists, used for query cost
+    estimated_rows = {"votes": 100, "counts": 3, "sources": 1}
+
     def resolve_votes(self, info):
-        return self.votes.all()
+        return load_related(self, info, "votes")
 
     def resolve_counts(self, info):
-        return self.counts.all()
+        return load_related(self, info, "counts")
 
     def resolve_sources(self, info):
-        return self.sources.all()
+        return load_related(self, info, "sources")
 
 
 class VoteConnection(graphene.relay.Connection):
@@ -265,6 +330,27 @@ class BillVoteConnection(graphene.relay.Connection):
         node = BillVoteNode
 
 
+# id prefix => model & node type, for looking up any OCD object by id
+OCD_NODES = {
+    "ocd-bill/": (Bill, BillNode),
+    "ocd-vote/": (VoteEvent, VoteEventNode),
+    "ocd-person/": (Person, PersonNode),
+    "ocd-organization/": (Organization, OrganizationNode),
+    "ocd-jurisdiction/": (Jurisdiction, JurisdictionNode),
+}
+
+
+class OCDNode(graphene.Union):
+    class Meta:
+        types = tuple(node for _, node in OCD_NODES.values())
+
+    @classmethod
+    def resolve_type(cls, instance, info):
+        for model, node in OCD_NODES.values():
+            if isinstance(instance, model):
+                return node
+
+
 class SponsorInput(graphene.InputObjectType):
     name = graphene.String(required=False)
     primary = graphene.Boolean(required=False)
@@ -292,6 +378,16 @@ class LegislativeQuery:
         action_since=graphene.String(),
         search_query=graphene.String(),
     )
+    bills_by_id = graphene.List(
+        BillNode, ids=graphene.List(graphene.NonNull(graphene.String), required=True)
+    )
+    nodes = graphene.List(
+        OCDNode, ids=graphene.List(graphene.NonNull(graphene.String), required=True)
+    )
+
+    # root fields whose results can be versioned (by latest updated_at & count) before
+    # they're executed, so unchanged results get a 304, see graphapi.caching
+    result_sets = {"bills": filter_bills}
 
     def resolve_bills(
         self,
@@ -300,79 +396,23 @@ class LegislativeQuery:
         after=None,
         first=None,
         last=None,
-        jurisdiction=None,
-        chamber=None,
-        session=None,
-        updated_since=None,
-        classification=None,
-        subject=None,
-        sponsor=None,
-        action_since=None,
-        search_query=None,
+        **filters,
     ):
-        # q (full text)
-        bills = Bill.objects.all()
-
-        if jurisdiction:
-            bills = bills.filter(**jurisdiction_query(jurisdiction))
-        subjects = [subject] if subject else []
-        bills = search_bills(
-            bills=bills,
-            query=search_query,
-            chamber=chamber,
-            session=session,
-            classification=classification,
-            subjects=subjects,
-            sort="-updated",
-        )
-        if updated_since:
-            bills = bills.filter(updated_at__gte=updated_since)
-        if action_since:
-            bills = bills.filter(latest_action_date__gte=action_since)
-        if sponsor:
-            sponsor_args = {}
-            if "primary" in sponsor:
-                sponsor_args["sponsorships__primary"] = sponsor["primary"]
-            if sponsor.get("person"):
-                sponsor_args["sponsorships__person_id"] = sponsor["person"]
-            elif sponsor.get("name"):
-                sponsor_args["sponsorships__name"] = sponsor["name"]
-            bills = bills.filter(**sponsor_args)
-
-        bills = optimize(
-            bills,
-            info,
-            [
-                ".abstracts",
-                ".otherTitles",
-                ".otherIdentifiers",
-                ".fromOrganization",
-                ".actions",
-                ".actions.organization",
-                ".actions.relatedEntities",
-                ".actions.relatedEntities.organization",
-                ".actions.relatedEntities.person",
-                ".actions.vote",
-                ".sponsorships",
-                ".documents",
-                ".versions",
-                ".documents.links",
-                ".versions.links",
-                ".sources",
-                ".relatedBills",
-                ".votes",
-                ".votes.counts",
-                (
-                    ".votes.votes",
-                    Prefetch(
-                        "votes__votes", PersonVote.objects.all().select_related("voter")
-                    ),
-                ),
-            ],
-            [".legislativeSession" ".legislativeSession.jurisdiction"],
-        )
-
-        return bills
+        return optimize(filter_bills(**filters), info)
+
+    def resolve_bills_by_id(self, info, ids):
+        return resolve_ids(optimize(Bill.objects.all(), info), ids)
+
+    def resolve_nodes(self, info, ids):
+        check_ids(ids)
+        # one query per type of object requested
+        found = {}
+        for prefix, (model, node) in OCD_NODES.items():
+            type_ids = [id for id in ids if id.startswith(prefix)]
+            if type_ids:
+                qs = optimize(model.objects.all(), info, member_type=node)
+                found.update(zip(type_ids, resolve_ids(qs, type_ids)))
+        return [found.get(id) for id in ids]
 
     def resolve_bill(
         self,
@@ -384,13 +424,14 @@ class LegislativeQuery:
         openstatesUrl=None,
     ):
         bill = None
+        bills = optimize(Bill.objects.all(), info)
 
         if jurisdiction and session and identifier:
             query = dict(legislative_session__identifier=session, identifier=identifier)
             query.update(jurisdiction_query(jurisdiction))
-            bill = Bill.objects.get(**query)
+            bill = bills.get(**query)
         if id:
-            bill = Bill.objects.get(id=id)
+            bill = bills.get(id=id)
         if openstatesUrl:
             # remove domain, start and end slashes
             path = urlparse(openstatesUrl).path.strip("/")
@@ -404,12 +445,7 @@ class LegislativeQuery:
                 session = m["session"]
 
                 # query Bill with components
-                # (this bit taken from def bill in views/bills.py)
-                bill = Bill.objects.select_related(
-                    "legislative_session",
-                    "legislative_session__jurisdiction",
-                    "from_organization",
-                ).get(
+                bill = bills.get(
                     legislative_session__jurisdiction_id=jid,
                     legislative_session__identifier=session,
                     identifier=identifier,
@@ -0,0 +1,102 @@
+import threading
+from collections import defaultdict
+from promise import Promise
+from promise.dataloader import DataLoader
+from graphql.type.definition import get_named_type
+from .caching import last_scraped
+from .optimization import _is_connection
+
+
+class RelatedListLoader(DataLoader):
+    """batch-load a reverse foreign key relation for many parents in one query"""
+
+    def __init__(self, related_model, fk_attname):
+        super().__init__()
+        self.related_model = related_model
+        self.fk_attname = fk_attname
+
+    def batch_load_fn(self, keys):
+        by_parent = defaultdict(list)
+        qs = self.related_model.objects.filter(**{self.fk_attname + "__in": keys})
+        for obj in qs:
+            by_parent[getattr(obj, self.fk_attname)].append(obj)
+        return Promise.resolve([by_parent[key] for key in keys])
+
+
+class LastScrapedLoader(DataLoader):
+    """batch-load the end time of the latest successful scrape of jurisdictions"""
+
+    def batch_load_fn(self, keys):
+        times = last_scraped(keys)
+        return Promise.resolve([times[key] for key in keys])
+
+
+_loaders_lock = threading.Lock()
+
+
+def _context_loaders(info):
+    # loaders are stored on the request (info.context) so batches and caches never
+    # outlive a single GraphQL execution
+    context = info.context
+    if context is None:
+        return None
+
+    with _loaders_lock:
+        loaders = getattr(context, "_graphapi_loaders", None)
+        if loaders is None:
+            loaders = context._graphapi_loaders = {}
+        # DataLoaders aren't thread-safe, root fields resolved in their own threads
+        # (see ConcurrentRootExecutor) each get their own
+        return loaders.setdefault(threading.get_ident(), {})
+
+
+def get_loader(info, model, field_name):
+    """
+    get the loader for model.field_name scoped to the current execution
+
+    returns None if there is no context to store the loader on
+    """
+    loaders = _context_loaders(info)
+    if loaders is None:
+        return None
+
+    key = (model, field_name)
+    if key not in loaders:
+        relation = model._meta.get_field(field_name)
+        loaders[key] = RelatedListLoader(relation.related_model, relation.field.attname)
+    return loaders[key]
+
+
+def load_related(root_obj, info, field_name):
+    """
+    resolve a reverse foreign key relation, batching across sibling objects
+
+    objects that already have the relation prefetched (via optimize) are served
+    from the prefetch cache, otherwise the parent id is queued on a loader so all
+    parents reaching this field are loaded with a single IN (...) query
+    """
+    if field_name in getattr(root_obj, "_prefetched_objects_cache", []):
+        return getattr(root_obj, field_name).all()
+    # connections are paged with LIMIT, loading every row of every parent defeats it
+    if _is_connection(get_named_type(info.return_type)):
+        return getattr(root_obj, field_name).all()
+
+    loader = get_loader(info, type(root_obj), field_name)
+    if loader is None:
+        return getattr(root_obj, field_name).all()
+    return loader.load(root_obj.pk)
+
+
+def load_last_scraped(jurisdiction, info):
+    """
+    resolve when a jurisdiction was last scraped, batching across jurisdictions
+
+    all jurisdictions reaching this field are looked up with a single query, see
+    caching.last_scraped
+    """
+    loaders = _context_loaders(info)
+    if loaders is None:
+        return last_scraped([jurisdiction.pk])[jurisdiction.pk]
+    if "last_scraped" not in loaders:
+        loaders["last_scraped"] = LastScrapedLoader()
+    return loaders["last_scraped"].load(jurisdiction.pk)
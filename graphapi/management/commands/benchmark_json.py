@@ -0,0 +1,54 @@
+import json
+import timeit
+from django.core.management.base import BaseCommand
+from graphapi.schema import schema
+from utils import serializers
+
+QUERY = """{
+  bills(first: 100) {
+    edges {
+      node {
+        id identifier title classification subject createdAt updatedAt
+        legislativeSession { identifier jurisdiction { name } }
+        actions { date description classification order organization { name } }
+        sponsorships { name primary classification }
+        votes {
+          edges {
+            node {
+              motionText startDate result
+              counts { option value }
+              votes { option voterName }
+            }
+          }
+        }
+      }
+    }
+  }
+}"""
+
+
+class Command(BaseCommand):
+    help = "compare JSON encoding of a large GraphQL response with the stdlib path"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=100)
+
+    def handle(self, *args, **options):
+        result = schema.execute(QUERY)
+        if result.errors:
+            raise Exception(result.errors)
+        response = {"data": result.data}
+        bills = len(result.data["bills"]["edges"])
+
+        encoders = {
+            # graphene-django's GraphQLView.json_encode
+            "json.dumps": lambda: json.dumps(response, separators=(",", ":")),
+            "serializers.dumps": lambda: serializers.dumps(response),
+        }
+        self.stdout.write(
+            f"{bills} bills, {len(encoders['json.dumps']())} bytes, "
+            f"orjson {'installed' if serializers.orjson else 'not installed'}"
+        )
+        for name, encode in encoders.items():
+            seconds = timeit.timeit(encode, number=options["number"])
+            self.stdout.write(f"{name:>20}: {seconds / options['number'] * 1000:.3f}ms")
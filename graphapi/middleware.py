@@ -1,5 +1,11 @@
+import contextlib
 import logging
-from graphql.language.ast import FragmentSpread, Variable
+import threading
+import time
+from django.db import connection, OperationalError
+from graphql.language.ast import FragmentSpread, InlineFragment, Variable
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type
+from .optimization import _to_snake
 
 
 class QueryCostException(Exception):
@@ -8,49 +14,460 @@ class QueryCostException(Exception):
 
 log = logging.getLogger("graphapi")
 
+# rows assumed for a list of objects whose node type doesn't declare estimated_rows
+DEFAULT_ESTIMATED_ROWS = 10
 
-def _get_counts(info, fragments, variable_values):
-    multiplier = 1
-    inner_multiplier = 0
 
-    if isinstance(info, FragmentSpread):
-        for selection in fragments[info.name.value].selection_set.selections:
-            inner_multiplier += _get_counts(selection, fragments, variable_values)
-    else:
-        # the multiplier is either 1 or the number of elements returned
-        for argument in info.arguments:
-            if argument.name.value in ("first", "last"):
-                if isinstance(argument.value, Variable):
-                    multiplier = variable_values[argument.value.name.value]
-                else:
-                    multiplier = int(argument.value.value)
+def _estimated_rows(parent_type, field_name):
+    """look up estimated_rows declared on the graphene type (or its bases)"""
+    graphene_type = getattr(parent_type, "graphene_type", None)
+    if graphene_type is None:
+        return DEFAULT_ESTIMATED_ROWS
+    name = _to_snake(field_name)
+    for cls in graphene_type.__mro__:
+        rows = cls.__dict__.get("estimated_rows", {})
+        if name in rows:
+            return rows[name]
+    return DEFAULT_ESTIMATED_ROWS
 
-        # count up how many multi-nodes inside
-        if info.selection_set:
-            for selection in info.selection_set.selections:
-                inner_multiplier += _get_counts(selection, fragments, variable_values)
+
+def _is_object_list(field_type):
+    if isinstance(field_type, GraphQLNonNull):
+        field_type = field_type.of_type
+    return isinstance(field_type, GraphQLList) and hasattr(
+        get_named_type(field_type), "fields"
+    )
+
+
+def _is_connection(graphql_type):
+    return hasattr(graphql_type, "fields") and "edges" in graphql_type.fields
+
+
+def _selection_cost(
+    selection_set, parent_type, schema, fragments, variable_values, page_size=None
+):
+    cost = 0
+    for selection in selection_set.selections:
+        if isinstance(selection, FragmentSpread):
+            fragment = fragments[selection.name.value]
+            cost += _selection_cost(
+                fragment.selection_set,
+                schema.get_type(fragment.type_condition.name.value),
+                schema,
+                fragments,
+                variable_values,
+                page_size,
+            )
+        elif isinstance(selection, InlineFragment):
+            type_ = parent_type
+            if selection.type_condition:
+                type_ = schema.get_type(selection.type_condition.name.value)
+            cost += _selection_cost(
+                selection.selection_set,
+                type_,
+                schema,
+                fragments,
+                variable_values,
+                page_size,
+            )
+        else:
+            cost += _field_cost(
+                selection, parent_type, schema, fragments, variable_values, page_size
+            )
+    return cost
+
+
+def _field_cost(
+    field_ast, parent_type, schema, fragments, variable_values, page_size=None
+):
+    field_name = field_ast.name.value
+    field_def = getattr(parent_type, "fields", {}).get(field_name)
+    if field_def is None:
+        # introspection fields like __typename
+        return 1
+
+    # the multiplier is the page size for paginated fields, the number of ids for
+    # lookups by id, otherwise an estimate for unbounded lists, & 1 for a single node
+    # (or edges of an already-sized page)
+    multiplier = None
+    for argument in field_ast.arguments:
+        if argument.name.value in ("first", "last"):
+            if isinstance(argument.value, Variable):
+                multiplier = variable_values[argument.value.name.value]
+            else:
+                multiplier = int(argument.value.value)
+        elif argument.name.value == "ids":
+            if isinstance(argument.value, Variable):
+                multiplier = len(variable_values[argument.value.name.value] or [])
+            else:
+                multiplier = len(getattr(argument.value, "values", [argument.value]))
+    field_type = get_named_type(field_def.type)
+    # page_size replaces whatever page the query asked for, see ExportPager
+    if page_size is not None and _is_connection(field_type):
+        multiplier = page_size
+    if multiplier is None:
+        if _is_connection(parent_type) and field_name == "edges":
+            multiplier = 1
+        elif _is_object_list(field_def.type) or _is_connection(field_type):
+            multiplier = _estimated_rows(parent_type, field_name)
+        else:
+            multiplier = 1
+
+    inner = 0
+    if field_ast.selection_set:
+        inner = _selection_cost(
+            field_ast.selection_set, field_type, schema, fragments, variable_values
+        )
 
     # if this wasn't a multi-node, this counts as one node
-    if inner_multiplier == 0:
-        inner_multiplier = 1
+    return multiplier * (inner or 1)
+
+
+def _cost_variables(selection_set, fragments, seen=None):
+    """get the names of the variables the cost estimate reads (first, last & ids)"""
+    names = set()
+    seen = set() if seen is None else seen
+    for selection in selection_set.selections if selection_set else ():
+        if isinstance(selection, FragmentSpread):
+            if selection.name.value in seen:
+                continue
+            seen.add(selection.name.value)
+            selection = fragments[selection.name.value]
+        elif not isinstance(selection, InlineFragment):
+            for argument in selection.arguments:
+                if argument.name.value in ("first", "last", "ids") and isinstance(
+                    argument.value, Variable
+                ):
+                    names.add(argument.value.name.value)
+        names |= _cost_variables(selection.selection_set, fragments, seen)
+    return names
 
-    return multiplier * inner_multiplier
+
+def estimate_cost(info, page_size=None):
+    """
+    estimate the number of rows an entire operation will touch
+
+    page_size is the number of rows each root connection will actually be resolved
+    with, regardless of its arguments
+    """
+    return _selection_cost(
+        info.operation.selection_set,
+        info.schema.get_query_type(),
+        info.schema,
+        info.fragments,
+        info.variable_values,
+        page_size,
+    )
 
 
 class QueryProtectionMiddleware(object):
+    # costs kept per document, so clients varying first can't grow it forever
+    max_cached_costs = 64
+
     def __init__(self, max_cost=5000):
         self.max_cost = max_cost
 
+    def _cost_cache(self, info):
+        # cached documents keep their AST alive, so costs can live on the document,
+        # otherwise costs are only kept for the current request
+        document = getattr(info.context, "graphql_document", None)
+        if document is not None:
+            return document.costs
+        if info.context is None:
+            return {}
+        if not hasattr(info.context, "graphql_costs"):
+            info.context.graphql_costs = {}
+        return info.context.graphql_costs
+
+    def get_cost(self, info):
+        # only the variables passed to first/last & the length of ids can change the
+        # cost of an operation, other variables don't need their own entry
+        values = []
+        for name in sorted(
+            _cost_variables(info.operation.selection_set, info.fragments)
+        ):
+            value = info.variable_values.get(name)
+            values.append((name, len(value) if isinstance(value, list) else value))
+        page_size = self.get_page_size(info)
+        key = (id(info.operation), tuple(values), page_size)
+
+        costs = self._cost_cache(info)
+        if key not in costs:
+            if len(costs) >= self.max_cached_costs:
+                costs.clear()
+            costs[key] = estimate_cost(info, page_size)
+        return costs[key]
+
+    def get_page_size(self, info):
+        # exports fetch every page with the connection's max_items, not first
+        if getattr(info.context, "graphql_export", None) is None:
+            return None
+        connection_type = getattr(
+            get_named_type(info.return_type), "graphene_type", None
+        )
+        return getattr(connection_type, "max_items", None)
+
+    def get_max_cost(self, info):
+        # costs are estimated rows, so operations the request's SQL budget would
+        # abort mid-execution are rejected before they run
+        budget = getattr(info.context, "graphql_budget", None)
+        if budget is not None:
+            return budget.max_rows
+        return self.max_cost
+
     def resolve(self, next, root, info, **args):
         if root is None:
-            count = _get_counts(
-                info.field_asts[0], info.fragments, info.variable_values
-            )
+            count = self.get_cost(info)
+            if info.context is not None:
+                # reported in the response extensions by KeyedGraphQLView
+                info.context.graphql_cost = count
             log.debug(
                 f"graphql query name={info.field_name} asts={info.field_asts} cost={count}"
             )
-            if count > self.max_cost:
+            max_cost = self.get_max_cost(info)
+            if count > max_cost:
                 raise QueryCostException(
-                    f"Query Cost is too high ({count}), limit is {self.max_cost}"
+                    f"Query Cost is too high ({count}), limit is {max_cost}"
                 )
         return next(root, info, **args)
+
+
+class QueryBudgetException(Exception):
+    pass
+
+
+def _set_statement_timeout(milliseconds):
+    """
+    set statement_timeout on the current thread's connection, unless it's already set
+
+    connections are reused (see CONN_MAX_AGE), so the timeout is left on the
+    connection for the next budget instead of being reset, timeouts set inside a
+    transaction aren't remembered since a rollback would undo them
+    """
+    connection.ensure_connection()
+    if getattr(connection, "graphql_statement_timeout", None) == (
+        connection.connection,
+        milliseconds,
+    ):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SET statement_timeout = %s", [milliseconds])
+    if not connection.in_atomic_block:
+        connection.graphql_statement_timeout = (connection.connection, milliseconds)
+
+
+class SQLBudget(object):
+    """
+    limit the SQL statements & rows a GraphQL request actually executes
+
+    unlike the estimated cost, this counts what really runs, so it also stops queries
+    the estimate gets wrong, once either limit is exceeded each statement fails with a
+    QueryBudgetException, on PostgreSQL each statement is also limited to seconds
+    with statement_timeout, so one runaway query can't hold a worker
+    """
+
+    def __init__(self, queries, rows, seconds=None):
+        self.max_queries = queries
+        self.max_rows = rows
+        self.seconds = seconds
+        self.queries = 0
+        self.rows = 0
+        # root fields may be resolved in other threads, see ConcurrentRootExecutor
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def guard(self):
+        """enforce the budget on the current thread's database connection"""
+        if connection.vendor == "postgresql":
+            # 0 disables the timeout, in case an earlier guard set one
+            _set_statement_timeout(int(self.seconds * 1000) if self.seconds else 0)
+        with connection.execute_wrapper(self._check):
+            yield self
+
+    def _check(self, execute, sql, params, many, context):
+        # counted & compared under the lock, so concurrent threads can't both pass
+        with self._lock:
+            self.queries += 1
+            over_queries = self.queries > self.max_queries
+            over_rows = self.rows > self.max_rows
+        if over_queries:
+            raise QueryBudgetException(
+                f"Query exceeded its budget of {self.max_queries} SQL queries"
+            )
+        if over_rows:
+            raise QueryBudgetException(
+                f"Query exceeded its budget of {self.max_rows} rows"
+            )
+
+        start = time.perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        except OperationalError as e:
+            if self.seconds and time.perf_counter() - start >= self.seconds:
+                raise QueryBudgetException(
+                    f"Query exceeded its budget of {self.seconds}s per SQL query"
+                ) from e
+            raise
+        rows = getattr(context["cursor"], "rowcount", -1)
+        if rows > 0:
+            with self._lock:
+                self.rows += rows
+                over_rows = self.rows > self.max_rows
+            if over_rows:
+                raise QueryBudgetException(
+                    f"Query exceeded its budget of {self.max_rows} rows"
+                )
+        return result
+
+
+# queries that run after their resolver returned (lazy lists, DataLoader batches)
+DEFERRED_PATH = "(deferred)"
+
+
+class ExecutionProfile(object):
+    """
+    per-request timings, SQL queries & rows fetched, grouped by resolver path
+
+    used as a context manager around execution so that every query is recorded,
+    queries are attributed to the resolver that is running when they execute
+    """
+
+    def __init__(self):
+        self.paths = {}
+        self._stack = []
+        self._wrapper = None
+        self._start = self._end = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._wrapper = connection.execute_wrapper(self._record_query)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._end = time.perf_counter()
+        return self._wrapper.__exit__(*exc_info)
+
+    def _stats(self, path):
+        if path not in self.paths:
+            self.paths[path] = {
+                "calls": 0,
+                "duration": 0.0,
+                "queries": 0,
+                "sqlTime": 0.0,
+                "rows": 0,
+            }
+        return self.paths[path]
+
+    def _record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats = self._stats(self._stack[-1] if self._stack else DEFERRED_PATH)
+            stats["queries"] += 1
+            stats["sqlTime"] += time.perf_counter() - start
+            rows = getattr(context["cursor"], "rowcount", -1)
+            if rows > 0:
+                stats["rows"] += rows
+
+    def enter(self, path):
+        self._stack.append(path)
+
+    def exit(self, path, duration):
+        self._stack.pop()
+        stats = self._stats(path)
+        stats["calls"] += 1
+        stats["duration"] += duration
+
+    def as_dict(self, cost=None):
+        def ms(seconds):
+            return round(seconds * 1000, 3)
+
+        resolvers = [
+            dict(
+                stats,
+                path=path,
+                duration=ms(stats["duration"]),
+                sqlTime=ms(stats["sqlTime"]),
+            )
+            for path, stats in self.paths.items()
+        ]
+        return {
+            "cost": cost,
+            "duration": ms((self._end or time.perf_counter()) - self._start),
+            "queries": sum(r["queries"] for r in resolvers),
+            "sqlTime": round(sum(r["sqlTime"] for r in resolvers), 3),
+            "rows": sum(r["rows"] for r in resolvers),
+            "resolvers": resolvers,
+        }
+
+
+class ProfilingMiddleware(object):
+    """
+    record an ExecutionProfile for requests that opted in
+
+    does nothing unless the view put an ExecutionProfile on the request
+    """
+
+    def resolve(self, next, root, info, **args):
+        profile = getattr(info.context, "graphql_profile", None)
+        if profile is None:
+            return next(root, info, **args)
+
+        # list indices are dropped so that a field is reported once for all nodes
+        path = ".".join(str(key) for key in info.path if not isinstance(key, int))
+        profile.enter(path)
+        start = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            profile.exit(path, time.perf_counter() - start)
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportPager(object):
+    """
+    page through the root connection of an export, one page per execution
+
+    each execution resolves the root connection with the largest page it allows,
+    starting after the last page, has_next_page is False once it's exhausted
+    """
+
+    def __init__(self):
+        self.after = None
+        self.has_next_page = True
+        self.pages = 0
+
+    def resolve(self, next, root, info, **args):
+        if root is not None:
+            return next(root, info, **args)
+
+        if len(info.operation.selection_set.selections) != 1:
+            raise ExportError("exports must select a single root field")
+        connection_type = getattr(
+            get_named_type(info.return_type), "graphene_type", None
+        )
+        max_items = getattr(connection_type, "max_items", None)
+        if not max_items:
+            raise ExportError(f"{info.field_name} can't be exported")
+
+        # the first page starts wherever the query asked
+        if self.pages == 0:
+            self.after = args.get("after")
+        args.pop("last", None)
+        args.pop("before", None)
+        args.update(first=max_items, after=self.after)
+        # deep pages of an export are much cheaper to seek to
+        if getattr(connection_type, "keyset_pagination", False):
+            args["keyset"] = True
+        return next(root, info, **args).then(self._next_page)
+
+    def _next_page(self, connection):
+        self.pages += 1
+        self.after = connection.page_info.end_cursor
+        self.has_next_page = connection.page_info.has_next_page
+        return connection
@@ -1,5 +1,8 @@
 import re
-from graphql.language.ast import FragmentSpread
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Prefetch
+from graphql.language.ast import FragmentSpread, InlineFragment
+from graphql.type.definition import get_named_type
 
 
 def _to_snake(word):
@@ -15,63 +18,311 @@ def transform_path(path):
     return "__".join(_to_snake(piece) for piece in pieces[1:])
 
 
-def get_field_names(info):
-    # info.operation has the entire operation, could be used for
-    # cross-query optimization potentially
-    return list(
-        _yield_field_names(info.field_asts[0].selection_set, "", info.fragments)
-    )
+class Relation:
+    """
+    describes how a node field is loaded from its model
 
+    fields are looked up as the model relation of the same name by default, nodes
+    list any exceptions in a relations dict: a relation name, a Relation to filter
+    or store the prefetched rows elsewhere, or None for fields that aren't loaded
+    from a relation
 
-def _yield_field_names(selection_set, prefix, fragments):
+    columns lists columns of the related model the parent's resolver reads (e.g.
+    to filter prefetched rows), fields computed from the node's own columns are
+    listed in a columns dict on the node
+
+    connection fields are paginated with a LIMIT per parent & aren't prefetched,
+    unless bounded marks a relation with few rows per parent, where loading them
+    for every parent at once beats a query per parent
+    """
+
+    def __init__(self, name, queryset=None, to_attr=None, columns=(), bounded=False):
+        self.name = name
+        self.queryset = queryset
+        self.to_attr = to_attr
+        self.columns = columns
+        self.bounded = bounded
+
+
+def _declared(graphene_type, attr):
+    """merge a dict declared on a node type & its bases (relations, columns)"""
+    declared = {}
+    for cls in reversed(getattr(graphene_type, "__mro__", ())):
+        declared.update(cls.__dict__.get(attr, {}))
+    return declared
+
+
+def get_relation(graphene_type, field_name):
+    """get the Relation behind a (camelCase) node field, None if it has none"""
+    name = _to_snake(field_name)
+    relation = _declared(graphene_type, "relations").get(name, name)
+    if isinstance(relation, str):
+        relation = Relation(relation)
+    return relation
+
+
+def _model_field(model, relation):
+    try:
+        return model._meta.get_field(relation.name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _is_connection(graphql_type):
+    return hasattr(graphql_type, "fields") and "edges" in graphql_type.fields
+
+
+def _node_type(graphql_type):
+    """unwrap lists & connections to get the type of the nodes a field returns"""
+    named = get_named_type(graphql_type)
+    if _is_connection(named):
+        edge = get_named_type(named.fields["edges"].type)
+        named = get_named_type(edge.fields["node"].type)
+    return named
+
+
+def _collect_fields(selection_set, fragments):
     if not selection_set:
         return
-
     for selection in selection_set.selections:
         if isinstance(selection, FragmentSpread):
-            yield from _yield_field_names(
-                fragments[selection.name.value].selection_set, prefix, fragments
+            yield from _collect_fields(
+                fragments[selection.name.value].selection_set, fragments
             )
+        elif isinstance(selection, InlineFragment):
+            yield from _collect_fields(selection.selection_set, fragments)
         else:
-            # normal handling for Field selections
-            if selection.name.value not in ("edges", "node"):
-                yield prefix + "." + selection.name.value
-                new_prefix = prefix + "." + selection.name.value
-                yield from _yield_field_names(
-                    selection.selection_set, new_prefix, fragments
-                )
+            yield selection
+
+
+def _node_fields(field_asts, graphql_type, fragments):
+    """get the fields selected on the nodes of a field, skipping edges { node }"""
+    for field in field_asts:
+        if not _is_connection(get_named_type(graphql_type)):
+            yield from _collect_fields(field.selection_set, fragments)
+            continue
+        for edges in _collect_fields(field.selection_set, fragments):
+            if edges.name.value != "edges":
+                continue
+            for node in _collect_fields(edges.selection_set, fragments):
+                if node.name.value == "node":
+                    yield from _collect_fields(node.selection_set, fragments)
+
+
+def _union_fields(selection_set, type_name, fragments):
+    """get the fields selected on one member type of a union"""
+    for selection in selection_set.selections:
+        if isinstance(selection, (FragmentSpread, InlineFragment)):
+            if isinstance(selection, FragmentSpread):
+                selection = fragments[selection.name.value]
+            condition = selection.type_condition
+            if condition and condition.name.value == type_name:
+                yield from _collect_fields(selection.selection_set, fragments)
             else:
-                yield from _yield_field_names(
-                    selection.selection_set, prefix, fragments
+                # fragments on the union itself may contain fragments on the member
+                yield from _union_fields(selection.selection_set, type_name, fragments)
+        else:
+            yield selection
+
+
+class _Plan:
+    """the columns, select_related paths & Prefetch querysets needed for a queryset"""
+
+    def __init__(self, model, columns=()):
+        self.model = model
+        # None if a selected field reads columns we don't know about
+        self.columns = set(columns)
+        self.select = set()
+        # keyed by where the rows end up, so fields sharing a relation share a query
+        self.prefetch = {}
+
+    def _add_columns(self, model, graphene_type, name, relation, model_field):
+        if self.columns is None:
+            return
+        declared = _declared(graphene_type, "columns")
+        if name in declared:
+            self.columns.update(declared[name])
+        elif relation is None:
+            pass
+        elif model_field is not None:
+            # plain columns & FKs, reverse relations only need the primary key
+            if model_field.concrete and not model_field.many_to_many:
+                self.columns.add(model_field.name)
+        elif hasattr(graphene_type, "resolve_" + name) or hasattr(model, name):
+            # computed from attributes we can't see, load every column
+            self.columns = None
+
+    def add(self, model, graphql_type, field_asts, fragments, path=""):
+        graphene_type = getattr(graphql_type, "graphene_type", None)
+        declared = _declared(graphene_type, "relations")
+        by_name = {}
+        for field in field_asts:
+            by_name.setdefault(field.name.value, []).append(field)
+
+        for name, same_fields in by_name.items():
+            if name.startswith("__") or name not in graphql_type.fields:
+                continue
+            relation = get_relation(graphene_type, name)
+            model_field = _model_field(model, relation) if relation else None
+            # only the queryset's own model is projected, selected models load fully
+            if not path:
+                self._add_columns(
+                    model, graphene_type, _to_snake(name), relation, model_field
                 )
 
+            field_type = graphql_type.fields[name].type
+            node_type = _node_type(field_type)
+            is_object = hasattr(node_type, "fields")
+            if model_field is None or not model_field.is_relation:
+                continue
+            # prefetching a connection would load every row of every parent
+            if _is_connection(get_named_type(field_type)) and not relation.bounded:
+                continue
+            # scalars are columns (e.g. jurisdiction_id) unless declared as relations
+            if not is_object and _to_snake(name) not in declared:
+                continue
+
+            child_fields = list(_node_fields(same_fields, field_type, fragments))
+            related_model = model_field.related_model
+
+            single = model_field.many_to_one or model_field.one_to_one
+            if single and not relation.queryset and not relation.to_attr:
+                lookup = path + relation.name
+                self.select.add(lookup)
+                if is_object:
+                    self.add(
+                        related_model, node_type, child_fields, fragments, lookup + "__"
+                    )
+            else:
+                key = path + (relation.to_attr or relation.name)
+                if key not in self.prefetch:
+                    # the FK back to the parent is needed to match up prefetched rows
+                    columns = list(relation.columns)
+                    if not model_field.concrete:
+                        columns.append(model_field.field.name)
+                    self.prefetch[key] = (
+                        path + relation.name,
+                        relation,
+                        _Plan(related_model, columns),
+                    )
+                if is_object:
+                    self.prefetch[key][2].add(
+                        related_model, node_type, child_fields, fragments
+                    )
+
+    def _only(self, queryset):
+        opts = self.model._meta
+        columns = set(self.columns)
+        # FKs followed by select_related can't be deferred
+        columns.update(path.split("__")[0] for path in self.select)
+        if isinstance(queryset.query.select_related, dict):
+            columns.update(queryset.query.select_related)
+        # sort keys are read to build keyset cursors
+        for name in queryset.query.order_by or opts.ordering:
+            if isinstance(name, str):
+                columns.add(name.lstrip("-"))
+
+        only = []
+        for name in sorted(columns):
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                only.append(field.name)
+        return queryset.only(*only)
+
+    def apply(self, queryset):
+        # select_related() without arguments would follow every non-null FK
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        prefetches = []
+        for lookup, relation, plan in self.prefetch.values():
+            related = plan.model._default_manager.all()
+            if relation.queryset:
+                related = relation.queryset(related)
+            prefetches.append(
+                Prefetch(lookup, plan.apply(related), to_attr=relation.to_attr)
+            )
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        if self.columns is not None:
+            queryset = self._only(queryset)
+        return queryset
+
+
+def optimize(queryset, info, member_type=None):
+    """
+    select & prefetch everything needed to resolve the current field from queryset
+
+    the plan is derived from the selection set, the node types & the model
+    relations, nested relations are prefetched with their own planned querysets
+
+    fields returning a union pass the member type the queryset is for, only the
+    fragments on that type are planned
+    """
+    if member_type is None:
+        node_type = _node_type(info.return_type)
+        fields = _node_fields(info.field_asts, info.return_type, info.fragments)
+    else:
+        node_type = info.schema.get_type(member_type._meta.name)
+        fields = (
+            selection
+            for field in info.field_asts
+            for selection in _union_fields(
+                field.selection_set, node_type.name, info.fragments
+            )
+        )
+    plan = _Plan(queryset.model)
+    plan.add(queryset.model, node_type, list(fields), info.fragments)
+    return plan.apply(queryset)
+
+
+def _check_type(graphql_type, model, seen):
+    if (graphql_type.name, model) in seen:
+        return
+    seen.add((graphql_type.name, model))
+
+    graphene_type = graphql_type.graphene_type
+    declared = _declared(graphene_type, "relations")
+    for name, field in graphql_type.fields.items():
+        node_type = _node_type(field.type)
+        is_object = hasattr(node_type, "fields")
+        relation = get_relation(graphene_type, name)
+        # scalars are columns unless they declare the relation they need
+        if relation is None or not (is_object or _to_snake(name) in declared):
+            continue
+
+        model_field = _model_field(model, relation)
+        where = f"{graphene_type.__name__}.{_to_snake(name)}"
+        if model_field is None:
+            raise ImproperlyConfigured(
+                f"{where} has no relation {relation.name!r} on {model.__name__}"
+            )
+        if not model_field.is_relation:
+            # object stored in a column (e.g. a JSONField)
+            continue
+
+        related_model = model_field.related_model
+        expected = getattr(getattr(node_type, "graphene_type", None), "model", None)
+        if expected and expected is not related_model:
+            raise ImproperlyConfigured(
+                f"{where} is a {related_model.__name__} relation, "
+                f"but {node_type.name} is for {expected.__name__}"
+            )
+        if is_object:
+            _check_type(node_type, related_model, seen)
+
 
-def optimize(queryset, info, prefetch, select_related=None, *, prefix=None):
-    to_prefetch = set()
-    to_select = set()
-    field_names = get_field_names(info)
-
-    # only take fields that are within prefix (used for Prefetch() sub-field optimization)
-    if prefix:
-        field_names = [
-            fn.replace(prefix, "") for fn in field_names if fn.startswith(prefix)
-        ]
-
-    if prefetch:
-        for field in prefetch:
-            if isinstance(field, tuple):
-                field, prefetch_name = field
-                if field in field_names:
-                    to_prefetch.add(prefetch_name)
-            elif isinstance(field, str):
-                if field in field_names:
-                    to_prefetch.add(transform_path(field))
-        queryset = queryset.prefetch_related(*to_prefetch)
-
-    if select_related:
-        for field in select_related:
-            if field in field_names:
-                to_select.add(transform_path(field))
-        queryset = queryset.select_related(*to_select)
-
-    return queryset
+def check_relations(schema):
+    """
+    check that every object field reachable from a node with a model maps to a
+    model relation, so a field drifting from the models fails at startup instead
+    of silently skipping its prefetch
+    """
+    seen = set()
+    for graphql_type in schema.get_type_map().values():
+        graphene_type = getattr(graphql_type, "graphene_type", None)
+        model = getattr(graphene_type, "model", None)
+        if model is not None:
+            _check_type(graphql_type, model, seen)
@@ -0,0 +1,63 @@
+import json
+from django.conf import settings
+from django.core.cache import caches
+from .backend import document_hash
+
+
+class PersistedQueryError(Exception):
+    code = "PERSISTED_QUERY_ERROR"
+
+
+class PersistedQueryNotFound(PersistedQueryError):
+    code = "PERSISTED_QUERY_NOT_FOUND"
+
+    def __init__(self):
+        super().__init__("PersistedQueryNotFound")
+
+
+def _cache_key(sha256_hash):
+    return "apq~{}".format(sha256_hash)
+
+
+def get_extensions(request, data):
+    extensions = data.get("extensions") or request.GET.get("extensions")
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise PersistedQueryError("extensions must be valid JSON")
+    return extensions or {}
+
+
+def resolve_persisted_query(request, data):
+    """
+    implement the Automatic Persisted Queries protocol
+
+    if the request carries extensions.persistedQuery, either register the provided
+    query text under its sha256 hash, or look up the text for a hash-only request,
+    returns data with the full query text filled in
+    """
+    persisted = get_extensions(request, data).get("persistedQuery")
+    if not persisted:
+        return data
+
+    if persisted.get("version") != 1:
+        raise PersistedQueryError("unsupported persistedQuery version")
+    sha256_hash = persisted.get("sha256Hash")
+    if not sha256_hash:
+        raise PersistedQueryError("persistedQuery requires sha256Hash")
+
+    cache = caches["default"]
+    query = data.get("query") or request.GET.get("query")
+    if query:
+        if document_hash(query) != sha256_hash:
+            raise PersistedQueryError("provided sha256Hash does not match query")
+        cache.set(
+            _cache_key(sha256_hash), query, settings.GRAPHQL_PERSISTED_QUERY_TIMEOUT
+        )
+        return data
+
+    query = cache.get(_cache_key(sha256_hash))
+    if query is None:
+        raise PersistedQueryNotFound()
+    return {**data, "query": query}
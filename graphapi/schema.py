@@ -1,6 +1,7 @@
 import graphene
 from .legislative import LegislativeQuery
 from .core import CoreQuery
+from .optimization import check_relations
 
 
 class Query(LegislativeQuery, CoreQuery, graphene.ObjectType):
@@ -8,3 +9,5 @@ class Query(LegislativeQuery, CoreQuery, graphene.ObjectType):
 
 
 schema = graphene.Schema(query=Query)
+# fail at startup if a node field doesn't map onto the models
+check_relations(schema)
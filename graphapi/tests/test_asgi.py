@@ -0,0 +1,109 @@
+import threading
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import AsyncClient
+from openstates.data.models import Division, Jurisdiction
+from .utils import populate_db
+from .. import executors
+from ..executors import shutdown_pool
+
+
+# the async view runs in worker threads with their own database connections, so data
+# must be committed for them to see it
+@pytest.fixture
+def jurisdictions(transactional_db):
+    caches["default"].clear()
+    u = User.objects.create(username="async-user")
+    u.profile.api_key = "async-key"
+    u.profile.api_tier = "unlimited"
+    u.profile.save()
+    for abbr, name in (("ak", "Alaska"), ("wy", "Wyoming")):
+        d = Division.objects.create(
+            id="ocd-division/country:us/state:" + abbr, name=name
+        )
+        Jurisdiction.objects.create(
+            id=f"ocd-jurisdiction/country:us/state:{abbr}/government",
+            name=name,
+            division=d,
+        )
+    yield
+    # the pool's threads keep their connections, which would block dropping the db
+    shutdown_pool()
+
+
+def _get(params):
+    return async_to_sync(AsyncClient().get)("/graphql/async", params)
+
+
+def test_async_graphql_requires_key(jurisdictions):
+    resp = _get({"query": '{ jurisdiction(name: "Alaska") { name } }'})
+    assert resp.status_code == 403
+
+
+def test_async_graphql_concurrent_root_fields(jurisdictions):
+    query = """{
+        alaska: jurisdiction(name: "Alaska") { name }
+        wyoming: jurisdiction(name: "Wyoming") { name }
+        missing: jurisdiction(name: "Atlantis") { name }
+    }"""
+    resp = _get({"apikey": "async-key", "query": query})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["data"]["alaska"] == {"name": "Alaska"}
+    assert data["data"]["wyoming"] == {"name": "Wyoming"}
+    # an error in one root field doesn't affect the others
+    assert data["data"]["missing"] is None
+    assert len(data["errors"]) == 1
+
+
+@pytest.fixture
+def bills(transactional_db):
+    caches["default"].clear()
+    u = User.objects.create(username="async-user")
+    u.profile.api_key = "async-key"
+    u.profile.api_tier = "unlimited"
+    u.profile.save()
+    populate_db()
+    yield
+    shutdown_pool()
+
+
+def test_async_graphql_fanout_limited(jurisdictions, monkeypatch):
+    threads = set()
+    process = executors.process
+
+    def record_thread(*args, **kwargs):
+        threads.add(threading.get_ident())
+        return process(*args, **kwargs)
+
+    monkeypatch.setattr(executors, "process", record_thread)
+    query = "{ %s }" % " ".join(
+        f'j{i}: jurisdiction(name: "Alaska") {{ name }}' for i in range(10)
+    )
+    resp = _get({"apikey": "async-key", "query": query})
+    assert all(j == {"name": "Alaska"} for j in resp.json()["data"].values())
+    # a request never takes more of the pool than its fan-out limit
+    assert 0 < len(threads) <= 4
+
+
+def test_async_graphql_concurrent_nested_fields(bills, client):
+    query = """{
+        alaska: bills(jurisdiction: "Alaska", first: 20) {
+            edges { node { identifier sponsorships { name } actions { description } } }
+        }
+        wyoming: bills(jurisdiction: "Wyoming", first: 20) {
+            edges { node { identifier sponsorships { name } actions { description } } }
+        }
+    }"""
+    resp = _get({"apikey": "async-key", "query": query})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert "errors" not in data
+    assert data["data"]["alaska"]["edges"]
+    assert data["data"]["wyoming"]["edges"]
+
+    # nested lists completed in each thread match a synchronous execution
+    expected = client.get("/graphql", {"apikey": "async-key", "query": query}).json()
+    assert data == expected
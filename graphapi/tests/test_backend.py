@@ -0,0 +1,100 @@
+import pytest
+from types import SimpleNamespace
+from graphapi.schema import schema
+from .utils import populate_db
+from ..backend import CachedGraphQLBackend
+from ..middleware import QueryProtectionMiddleware
+
+
+@pytest.mark.django_db
+def setup():
+    populate_db()
+
+
+def test_document_cache_hits_and_misses():
+    backend = CachedGraphQLBackend()
+    query = "{ jurisdictions { edges { node { name } } } }"
+    first = backend.document_from_string(schema, query)
+    second = backend.document_from_string(schema, query)
+    assert first is second
+    assert backend.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_document_cache_lru_eviction():
+    backend = CachedGraphQLBackend(max_size=2)
+    queries = {
+        alias: "{ %s: jurisdictions { edges { node { name } } } }" % alias
+        for alias in "abc"
+    }
+    a = backend.document_from_string(schema, queries["a"])
+    backend.document_from_string(schema, queries["b"])
+    # touch a so that b is the least recently used
+    backend.document_from_string(schema, queries["a"])
+    backend.document_from_string(schema, queries["c"])
+    assert backend.stats()["size"] == 2
+    assert backend.document_from_string(schema, queries["a"]) is a
+    backend.document_from_string(schema, queries["b"])
+    assert backend.misses == 4
+
+
+def test_document_cache_invalid_not_cached():
+    backend = CachedGraphQLBackend()
+    document = backend.document_from_string(schema, "{ notAField }")
+    result = document.execute()
+    assert result.invalid
+    assert "notAField" in str(result.errors[0])
+    assert backend.stats()["size"] == 0
+
+
+@pytest.mark.django_db
+def test_cached_document_reuses_cost():
+    backend = CachedGraphQLBackend()
+    query = "query q($f: Int) { bills(first: $f) { edges { node { title } } } }"
+
+    for first in (5, 5, 10):
+        document = backend.document_from_string(schema, query)
+        result = document.execute(
+            context_value=SimpleNamespace(),
+            variable_values={"f": first},
+            middleware=[QueryProtectionMiddleware(0)],
+        )
+        assert f"({first})" in str(result.errors[0])
+
+    # one cost per distinct value of first
+    assert len(document.costs) == 2
+
+
+@pytest.mark.django_db
+def test_cached_document_cost_ignores_other_variables():
+    backend = CachedGraphQLBackend()
+    query = """query q($c: [String]) {
+        people(first: 5) { edges { node { currentMemberships(classification: $c) {
+            organization { name }
+        } } } }
+    }"""
+
+    document = backend.document_from_string(schema, query)
+    for n in range(1, 10):
+        document.execute(
+            context_value=SimpleNamespace(),
+            variable_values={"c": ["upper"] * n},
+            middleware=[QueryProtectionMiddleware(0)],
+        )
+    # the classifications don't change the cost, so they share one entry
+    assert len(document.costs) == 1
+
+
+@pytest.mark.django_db
+def test_cached_document_costs_bounded(monkeypatch):
+    monkeypatch.setattr(QueryProtectionMiddleware, "max_cached_costs", 3)
+    backend = CachedGraphQLBackend()
+    query = "query q($f: Int) { bills(first: $f) { edges { node { title } } } }"
+
+    document = backend.document_from_string(schema, query)
+    for first in range(1, 10):
+        document.execute(
+            context_value=SimpleNamespace(),
+            variable_values={"f": first},
+            middleware=[QueryProtectionMiddleware(0)],
+        )
+    assert len(document.costs) <= 3
@@ -0,0 +1,126 @@
+import datetime
+import threading
+import time
+import pytest
+from django.core.cache import caches
+from django.utils import timezone
+from graphql import parse
+from openstates.data.models import Jurisdiction, RunPlan
+from .utils import populate_db
+from ..caching import get_jurisdictions, data_version, single_flight
+
+
+@pytest.mark.django_db
+def setup():
+    populate_db()
+
+
+def test_get_jurisdictions():
+    document = parse(
+        """query q($j: String) {
+            bills(jurisdiction: $j, first: 10) { edges { node { id } } }
+            jurisdiction(name: "Wyoming") { name }
+        }"""
+    )
+    assert get_jurisdictions(document, "q", {"j": "Alaska"}) == {"Alaska", "Wyoming"}
+
+
+def test_get_jurisdictions_unscoped():
+    document = parse(
+        """{
+            bills(jurisdiction: "Alaska", first: 10) { edges { node { id } } }
+            people(first: 10) { edges { node { id } } }
+        }"""
+    )
+    assert get_jurisdictions(document, None, {}) is None
+
+
+@pytest.mark.django_db
+def test_data_version_changes_with_new_run():
+    caches["default"].clear()
+    assert data_version({"Alaska"}) == "none"
+
+    end_time = timezone.now()
+    RunPlan.objects.create(
+        jurisdiction=Jurisdiction.objects.get(name="Alaska"),
+        success=True,
+        start_time=end_time - datetime.timedelta(hours=1),
+        end_time=end_time,
+    )
+    # versions are cached briefly, once that expires the new run is picked up
+    assert data_version({"Alaska"}) == "none"
+    caches["default"].clear()
+    assert data_version({"Alaska"}) == end_time.isoformat()
+    assert data_version({"Wyoming"}) == "none"
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+    executing = threading.Event()
+
+    def execute():
+        calls.append(1)
+        executing.set()
+        # keep the first call in flight while the others arrive
+        time.sleep(0.2)
+        return "response", True
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(single_flight("k", execute, 5)))
+        for _ in range(3)
+    ]
+    threads[0].start()
+    executing.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [("response", True)] * 3
+
+
+def test_single_flight_unshared_result():
+    calls = []
+
+    def execute():
+        calls.append(1)
+        return "error", False
+
+    assert single_flight("k", execute, 5) == ("error", False)
+    assert single_flight("k", execute, 5) == ("error", False)
+    assert len(calls) == 2
+
+
+def test_single_flight_across_processes():
+    cache = caches["default"]
+    cache.clear()
+    # another process holds the lock & has shared its response
+    cache.set("gqllock~k", "token")
+    cache.set("gqlflight~k~token", "shared")
+    assert single_flight("k", lambda: ("executed", True), 5) == ("shared", True)
+
+    # the other process finished without sharing, so execute
+    cache.delete("gqlflight~k~token")
+    cache.delete("gqllock~k")
+    assert single_flight("k", lambda: ("executed", True), 5) == ("executed", True)
+
+
+def test_single_flight_result_shared_while_polling(monkeypatch):
+    cache = caches["default"]
+    cache.clear()
+    cache.set("gqllock~k", "token")
+    get = cache.get
+
+    def finish_flight(key, *args, **kwargs):
+        value = get(key, *args, **kwargs)
+        if key == "gqlflight~k~token" and value is None:
+            # the other process shares its response & releases the lock right after
+            # this one looked for it
+            cache.set("gqlflight~k~token", "shared")
+            cache.delete("gqllock~k")
+        return value
+
+    monkeypatch.setattr(cache, "get", finish_flight)
+    assert single_flight("k", lambda: ("executed", True), 5) == ("shared", True)
@@ -1,6 +1,10 @@
+import datetime
 import pytest
+from types import SimpleNamespace
+from django.core.cache import caches
+from django.utils import timezone
 from graphapi.schema import schema
-from openstates.data.models import Organization, Person
+from openstates.data.models import Jurisdiction, Organization, Person, RunPlan
 from .utils import populate_db
 
 
@@ -11,7 +15,7 @@ def setup():
 
 @pytest.mark.django_db
 def test_jurisdictions(django_assert_num_queries):
-    with django_assert_num_queries(2):
+    with django_assert_num_queries(1):
         result = schema.execute(
             """ {
             jurisdictions {
@@ -29,9 +33,54 @@ def test_jurisdictions(django_assert_num_queries):
     assert result.data["jurisdictions"]["edges"][1]["node"]["name"] == "Wyoming"
 
 
+@pytest.mark.django_db
+def test_jurisdictions_first_zero():
+    result = schema.execute(
+        "{ jurisdictions(first: 0) { edges { node { name } } totalCount } }"
+    )
+    assert result.errors is None
+    assert result.data["jurisdictions"]["edges"] == []
+    assert result.data["jurisdictions"]["totalCount"] == 2
+
+
+@pytest.mark.django_db
+def test_jurisdictions_last_scraped_at(django_assert_num_queries):
+    caches["default"].clear()
+    end_time = timezone.now()
+    for name in ("Alaska", "Wyoming"):
+        RunPlan.objects.create(
+            jurisdiction=Jurisdiction.objects.get(name=name),
+            success=True,
+            start_time=end_time - datetime.timedelta(hours=1),
+            end_time=end_time,
+        )
+    query = "{ jurisdictions { edges { node { name lastScrapedAt } } } }"
+
+    # 1 query for jurisdictions, 1 for the latest runs of all of them
+    with django_assert_num_queries(2):
+        result = schema.execute(query, context_value=SimpleNamespace())
+    assert result.errors is None
+    for edge in result.data["jurisdictions"]["edges"]:
+        assert edge["node"]["lastScrapedAt"] == str(end_time)
+
+    # the latest runs are cached until a new run is saved
+    with django_assert_num_queries(1):
+        schema.execute(query, context_value=SimpleNamespace())
+    RunPlan.objects.create(
+        jurisdiction=Jurisdiction.objects.get(name="Alaska"),
+        success=True,
+        start_time=end_time,
+        end_time=end_time + datetime.timedelta(hours=1),
+    )
+    with django_assert_num_queries(2):
+        result = schema.execute(query, context_value=SimpleNamespace())
+    times = [e["node"]["lastScrapedAt"] for e in result.data["jurisdictions"]["edges"]]
+    assert times == [str(end_time + datetime.timedelta(hours=1)), str(end_time)]
+
+
 @pytest.mark.django_db
 def test_jurisdictions_num_queries(django_assert_num_queries):
-    with django_assert_num_queries(4):
+    with django_assert_num_queries(3):
         result = schema.execute(
             """ {
             jurisdictions {
@@ -68,7 +117,7 @@ def test_jurisdictions_num_queries(django_assert_num_queries):
 @pytest.mark.django_db
 def test_jurisdictions_num_queries_subquery(django_assert_num_queries):
     # same as test_jurisdictions_num_queries but with slightly more complex filtering on nodes
-    with django_assert_num_queries(4):
+    with django_assert_num_queries(3):
         result = schema.execute(
             """ {
             jurisdictions {
@@ -104,7 +153,7 @@ def test_jurisdictions_num_queries_subquery(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_jurisdiction_by_id(django_assert_num_queries):
-    with django_assert_num_queries(5):
+    with django_assert_num_queries(3):
         result = schema.execute(
             """ {
             jurisdiction(id:"ocd-jurisdiction/country:us/state:wy/government") {
@@ -126,7 +175,7 @@ def test_jurisdiction_by_id(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_jurisdiction_by_name(django_assert_num_queries):
-    with django_assert_num_queries(5):
+    with django_assert_num_queries(3):
         result = schema.execute(
             """ {
             jurisdiction(name:"Wyoming") {
@@ -148,7 +197,7 @@ def test_jurisdiction_by_name(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_jurisdiction_chambers_current_members(django_assert_num_queries):
-    with django_assert_num_queries(5):
+    with django_assert_num_queries(3):
         result = schema.execute(
             """ {
             jurisdiction(name:"Wyoming") {
@@ -182,7 +231,7 @@ def test_people_by_member_of(django_assert_num_queries):
     ak_house = Organization.objects.get(
         jurisdiction__name="Alaska", classification="lower"
     )
-    with django_assert_num_queries(2):
+    with django_assert_num_queries(1):
         result = schema.execute(
             """ {
             people(memberOf: "%s", first: 50) {
@@ -205,7 +254,7 @@ def test_variable_people_by_member_of(django_assert_num_queries):
     ak_house = Organization.objects.get(
         jurisdiction__name="Alaska", classification="lower"
     )
-    with django_assert_num_queries(2):
+    with django_assert_num_queries(1):
         result = schema.execute(
             """
             query peeps($f: Int){
@@ -230,7 +279,7 @@ def test_people_by_ever_member_of(django_assert_num_queries):
     ak_house = Organization.objects.get(
         jurisdiction__name="Alaska", classification="lower"
     )
-    with django_assert_num_queries(2):
+    with django_assert_num_queries(1):
         result = schema.execute(
             """ {
             people(everMemberOf: "%s", first:50) {
@@ -303,6 +352,34 @@ def test_people_by_name():
     assert len(result.data["people"]["edges"]) == 1
 
 
+@pytest.mark.django_db
+def test_people_filters_no_duplicates():
+    hank = Person.objects.get(name="Hank Horn")
+    hank.other_names.create(name="Hank Horn Jr.")
+    hank.other_names.create(name="Henry 'Hank' Horn")
+    # a second current membership in the same division
+    membership = hank.memberships.get(post__isnull=False)
+    hank.memberships.create(post=membership.post, organization=membership.organization)
+    result = schema.execute(
+        """ {
+        byName: people(name: "Hank", first: 50) {
+            totalCount
+            edges { node { name } }
+        }
+        byDivision: people(divisionId: "%s", first: 50) {
+            totalCount
+            edges { node { name } }
+        }
+    }
+    """
+        % membership.post.division_id
+    )
+    assert result.errors is None
+    for people in result.data.values():
+        assert people["totalCount"] == 1
+        assert people["edges"] == [{"node": {"name": "Hank Horn"}}]
+
+
 @pytest.mark.django_db
 def test_people_by_party():
     result = schema.execute(
@@ -329,7 +406,7 @@ def test_people_by_party():
 
 @pytest.mark.django_db
 def test_people_num_queries(django_assert_num_queries):
-    with django_assert_num_queries(8):
+    with django_assert_num_queries(7):
         result = schema.execute(
             """ {
         people(first: 50) {
@@ -404,7 +481,7 @@ def test_people_total_count(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_people_current_memberships_classification(django_assert_num_queries):
-    with django_assert_num_queries(3):
+    with django_assert_num_queries(2):
         result = schema.execute(
             """ {
         people(first: 50) {
@@ -427,7 +504,7 @@ def test_people_current_memberships_classification(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_people_old_memberships(django_assert_num_queries):
-    with django_assert_num_queries(3):
+    with django_assert_num_queries(2):
         result = schema.execute(
             """{
         people(first: 50) {
@@ -490,6 +567,29 @@ def test_person_by_id(django_assert_num_queries):
     assert division["id"] == "ocd-division/country:us/state:ak/sldl:2"
 
 
+@pytest.mark.django_db
+def test_people_by_id(django_assert_num_queries):
+    ids = [p.id for p in Person.objects.order_by("name")[:2]]
+    ids.insert(1, "ocd-person/nonexistent")
+    # 1 query for the people, 1 for their current memberships
+    with django_assert_num_queries(2):
+        result = schema.execute(
+            """query people($ids: [ID!]!) {
+            peopleById(ids: $ids) {
+                id
+                currentMemberships { organization { name } }
+            }
+        }""",
+            variables={"ids": ids},
+        )
+    assert result.errors is None
+    assert [p and p["id"] for p in result.data["peopleById"]] == [
+        ids[0],
+        None,
+        ids[2],
+    ]
+
+
 @pytest.mark.django_db
 def test_person_email_shim(django_assert_num_queries):
     # email used to be available in contact_details, make sure they can still find it there
@@ -555,9 +655,9 @@ def test_organization_by_id(django_assert_num_queries):
     )
     sen = Organization.objects.get(jurisdiction__name="Wyoming", classification="upper")
 
-    # 1 query for legislature, 1 query each for children
+    # 1 query for legislature, 1 query for prefetched children
     # 1 query for senate w/ parent
-    with django_assert_num_queries(4):
+    with django_assert_num_queries(3):
         result = schema.execute(
             """ {
             leg: organization(id: "%s") {
@@ -611,7 +711,7 @@ def test_people_by_updated_since():
 
 @pytest.mark.django_db
 def test_jurisdiction_fragment(django_assert_num_queries):
-    with django_assert_num_queries(3):
+    with django_assert_num_queries(2):
         result = schema.execute(
             """
     fragment JurisdictionFields on JurisdictionNode {
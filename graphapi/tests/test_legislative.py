@@ -1,5 +1,10 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from graphql_relay.utils import base64, unbase64
 from graphapi.schema import schema
+from graphapi.common import DjangoConnectionField, KEYSET_PREFIX, MAX_IDS
+from graphapi.legislative import BillConnection
 from openstates.data.models import Bill, Person
 from .utils import populate_db
 
@@ -11,7 +16,7 @@ def setup():
 
 @pytest.mark.django_db
 def test_bill_by_id(django_assert_num_queries):
-    with django_assert_num_queries(17):
+    with django_assert_num_queries(16):
         result = schema.execute(
             """ {
             bill(id:"ocd-bill/1") {
@@ -130,7 +135,7 @@ def test_bill_by_jurisdiction_id_session_identifier(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_bill_openstates_url(django_assert_num_queries):
-    with django_assert_num_queries(2):
+    with django_assert_num_queries(1):
         result = schema.execute(
             """ {
             bill(jurisdiction:"ocd-jurisdiction/country:us/state:ak/government",
@@ -147,6 +152,48 @@ def test_bill_openstates_url(django_assert_num_queries):
         )
 
 
+@pytest.mark.django_db
+def test_bill_selects_related_objects(django_assert_num_queries):
+    # nested FKs are joined in rather than being fetched per object
+    with django_assert_num_queries(2):
+        result = schema.execute(
+            """ {
+            bills(jurisdiction: "Alaska", first: 50) {
+                edges { node {
+                    legislativeSession { identifier jurisdiction { name } }
+                    fromOrganization { name }
+                    actions { vote { motionText } }
+                } }
+            }
+        }"""
+        )
+    assert result.errors is None
+    for edge in result.data["bills"]["edges"]:
+        assert edge["node"]["legislativeSession"]["jurisdiction"]["name"] == "Alaska"
+
+
+@pytest.mark.django_db
+def test_bills_only_requested_columns(django_assert_num_queries):
+    with django_assert_num_queries(2) as captured:
+        result = schema.execute(
+            """ {
+            bills(first: 5) { edges { node {
+                identifier
+                actions { description }
+            } } }
+        }"""
+        )
+    assert result.errors is None
+    bills_sql, actions_sql = [q["sql"] for q in captured.captured_queries]
+    assert '."identifier"' in bills_sql
+    assert '."title"' not in bills_sql
+    assert '."extras"' not in bills_sql
+    # actions keep the bill FK so they can be matched to their bills
+    assert '."description"' in actions_sql
+    assert '."bill_id"' in actions_sql
+    assert '."classification"' not in actions_sql
+
+
 @pytest.mark.django_db
 def test_bill_by_openstates_url(django_assert_num_queries):
     with django_assert_num_queries(1):
@@ -203,8 +250,8 @@ def test_bill_by_jurisdiction_session_identifier_404():
 
 @pytest.mark.django_db
 def test_bills_by_jurisdiction(django_assert_num_queries):
-    # 2 bills queries + 2 count queries
-    with django_assert_num_queries(4):
+    # 2 bills queries, no count queries since totalCount isn't requested
+    with django_assert_num_queries(2):
         result = schema.execute(
             """ {
             ak: bills(jurisdiction:"Alaska", first: 50) {
@@ -222,7 +269,7 @@ def test_bills_by_jurisdiction(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_bills_by_chamber(django_assert_num_queries):
-    with django_assert_num_queries(4):
+    with django_assert_num_queries(2):
         result = schema.execute(
             """ {
             lower: bills(chamber:"lower", first:50) {
@@ -240,7 +287,7 @@ def test_bills_by_chamber(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_bills_by_session(django_assert_num_queries):
-    with django_assert_num_queries(4):
+    with django_assert_num_queries(2):
         result = schema.execute(
             """ {
             y2018: bills(session:"2018", first:50) {
@@ -258,7 +305,7 @@ def test_bills_by_session(django_assert_num_queries):
 
 @pytest.mark.django_db
 def test_bills_by_classification(django_assert_num_queries):
-    with django_assert_num_queries(4):
+    with django_assert_num_queries(2):
         result = schema.execute(
             """ {
             bills: bills(classification: "bill", first:50) {
@@ -339,7 +386,7 @@ def test_bills_by_updated_since():
 
 @pytest.mark.django_db
 def test_bills_queries(django_assert_num_queries):
-    with django_assert_num_queries(21):
+    with django_assert_num_queries(16):
         result = schema.execute(
             """ {
             bills(first: 50) { edges { node {
@@ -470,6 +517,90 @@ def test_bills_pagination_forward():
     assert len(bills) == 26
 
 
+@pytest.mark.django_db
+def test_bills_pagination_keyset(django_assert_num_queries):
+    query = """{
+        bills(first: 10, after:"%s", keyset: true) {
+            edges { node { identifier updatedAt } }
+            pageInfo { endCursor hasNextPage hasPreviousPage }
+        }
+    }"""
+    first_page = schema.execute(query % "")
+    cursor = first_page.data["bills"]["pageInfo"]["endCursor"]
+    assert unbase64(cursor).startswith(KEYSET_PREFIX)
+    assert first_page.data["bills"]["pageInfo"]["hasPreviousPage"] is False
+
+    # a seek is a single query regardless of depth
+    with django_assert_num_queries(1):
+        second_page = schema.execute(query % cursor)
+    assert second_page.data["bills"]["pageInfo"]["hasPreviousPage"] is False
+    assert (
+        second_page.data["bills"]["edges"][0]["node"]["updatedAt"]
+        <= first_page.data["bills"]["edges"][-1]["node"]["updatedAt"]
+    )
+
+    # offset cursors from before keyset pagination still work
+    offset_page = schema.execute(query % base64("arrayconnection:9"))
+    assert offset_page.data["bills"]["edges"] == second_page.data["bills"]["edges"]
+
+
+@pytest.mark.django_db
+def test_bills_pagination_keyset_opt_in():
+    result = schema.execute(
+        "{ bills(first: 10) { pageInfo { endCursor } } }",
+    )
+    cursor = result.data["bills"]["pageInfo"]["endCursor"]
+    assert unbase64(cursor) == "arrayconnection:9"
+
+    result = schema.execute(
+        "{ bills(last: 10, keyset: true) { edges { node { id } } } }",
+    )
+    assert "only supports 'first' and 'after'" in result.errors[0].message
+
+
+@pytest.mark.django_db
+def test_bills_pagination_invalid_cursor():
+    result = schema.execute(
+        "{ bills(first: 10, keyset: true) { pageInfo { endCursor } } }",
+    )
+    cursor = result.data["bills"]["pageInfo"]["endCursor"]
+
+    # a keyset cursor without keyset: true would otherwise restart at the first page
+    result = schema.execute(
+        '{ bills(first: 10, after: "%s") { edges { node { id } } } }' % cursor
+    )
+    assert "keyset cursors need keyset: true" in result.errors[0].message
+
+    for keyset in ("true", "false"):
+        result = schema.execute(
+            '{ bills(first: 10, after: "garbage", keyset: %s) { edges { node { id } } } }'
+            % keyset
+        )
+        assert "invalid cursor for 'after'" in result.errors[0].message
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("sort", ["latest_action_date", "-latest_action_date"])
+def test_keyset_pagination_nulls(sort):
+    pks = list(Bill.objects.values_list("pk", flat=True)[:5])
+    Bill.objects.filter(pk__in=pks).update(latest_action_date=None)
+    bills = Bill.objects.order_by(sort)
+
+    ids = []
+    after = None
+    while True:
+        connection = DjangoConnectionField.resolve_keyset_connection(
+            BillConnection, {"first": 3, "after": after}, bills
+        )
+        ids += [edge.node.id for edge in connection.edges]
+        if not connection.page_info.has_next_page:
+            break
+        after = connection.page_info.end_cursor
+
+    # rows with a NULL sort key aren't skipped (or repeated) by later pages
+    assert len(ids) == len(set(ids)) == Bill.objects.count()
+
+
 @pytest.mark.django_db
 def test_bills_pagination_backward():
     bills = []
@@ -578,6 +709,31 @@ def test_bills_by_sponsorships():
     assert len(bills) == 2
 
 
+@pytest.mark.django_db
+def test_bills_by_sponsorships_no_duplicates():
+    bill = Bill.objects.get(id="ocd-bill/1")
+    sponsorship = bill.sponsorships.filter(person__isnull=False)[0]
+    # the same sponsor listed twice
+    bill.sponsorships.create(
+        name=sponsorship.name,
+        person=sponsorship.person,
+        entity_type="person",
+        primary=sponsorship.primary,
+        classification="cosponsor",
+    )
+    result = schema.execute(
+        """{
+        bills(sponsor: {person: "%s"}, first: 100) {
+            totalCount
+            edges { node { id } }
+        }
+    }"""
+        % sponsorship.person_id
+    )
+    ids = [n["node"]["id"] for n in result.data["bills"]["edges"]]
+    assert len(ids) == len(set(ids)) == result.data["bills"]["totalCount"]
+
+
 @pytest.mark.django_db
 def test_bills_by_action_since():
     result = schema.execute(
@@ -633,6 +789,27 @@ def test_votes_via_person():
     )
 
 
+@pytest.mark.django_db
+def test_votes_via_person_paged_in_sql():
+    with CaptureQueriesContext(connection) as captured:
+        result = schema.execute(
+            """{
+            people(name: "Amanda", first: 100) {
+                edges { node { votes(first: 1) { edges { node { option } } } } }
+            }
+        }"""
+        )
+    assert result.errors is None
+    # each person's votes are limited to the page (& one more row) in SQL
+    votes_sql = [
+        q["sql"] for q in captured.captured_queries if "personvote" in q["sql"]
+    ]
+    assert len(votes_sql) == 1
+    assert "LIMIT 2" in votes_sql[0]
+    people = [n["node"] for n in result.data["people"]["edges"]]
+    assert len(people[0]["votes"]["edges"]) == 1
+
+
 @pytest.mark.django_db
 def test_bill_fts():
     result = schema.execute(
@@ -651,7 +828,7 @@ def test_bill_fts():
 
 @pytest.mark.django_db
 def test_bills_order(django_assert_num_queries):
-    with django_assert_num_queries(2):
+    with django_assert_num_queries(1):
         result = schema.execute(
             """ {
             ak: bills(jurisdiction:"Alaska", first: 50) {
@@ -719,7 +896,7 @@ query bills($jurisdiction: String, $session: String, $end_cursor: String, $updat
         "end_cursor": "",
         "updated_since": "1900-01-01",
     }
-    with django_assert_num_queries(16):
+    with django_assert_num_queries(13):
         result = schema.execute(query, variables)
     assert result.errors is None
     assert result.data["bills"]["totalCount"] == 26
@@ -753,7 +930,58 @@ def test_real_example_bill_query(django_assert_num_queries):
         sources { url note }
       }
     }"""
-    with django_assert_num_queries(14):
+    with django_assert_num_queries(10):
         result = schema.execute(query)
     assert result.errors is None
     assert result.data["bill"] is not None
+
+
+@pytest.mark.django_db
+def test_bills_by_id(django_assert_num_queries):
+    # 1 query for the bills, 1 for their actions
+    with django_assert_num_queries(2):
+        result = schema.execute(
+            """{
+            billsById(ids: ["ocd-bill/3", "ocd-bill/nonexistent", "ocd-bill/1"]) {
+                id
+                actions { description }
+            }
+        }"""
+        )
+    assert result.errors is None
+    bills = result.data["billsById"]
+    assert [b and b["id"] for b in bills] == ["ocd-bill/3", None, "ocd-bill/1"]
+    assert len(bills[2]["actions"]) == 3
+
+
+@pytest.mark.django_db
+def test_bills_by_id_limit():
+    ids = ", ".join(f'"ocd-bill/{i}"' for i in range(MAX_IDS + 1))
+    result = schema.execute("{ billsById(ids: [%s]) { id } }" % ids)
+    assert "at most" in str(result.errors[0])
+
+
+@pytest.mark.django_db
+def test_nodes(django_assert_num_queries):
+    person = Person.objects.get(name="Bob Birch")
+    # one query per type of object
+    with django_assert_num_queries(3):
+        result = schema.execute(
+            """{
+            nodes(ids: ["%s", "ocd-bill/1", "ocd-event/1",
+                        "ocd-jurisdiction/country:us/state:ak/government"]) {
+                __typename
+                ... on BillNode { title }
+                ... on PersonNode { name }
+                ... on JurisdictionNode { name }
+            }
+        }"""
+            % person.id
+        )
+    assert result.errors is None
+    assert result.data["nodes"] == [
+        {"__typename": "PersonNode", "name": "Bob Birch"},
+        {"__typename": "BillNode", "title": "Moose Freedom Act"},
+        None,
+        {"__typename": "JurisdictionNode", "name": "Alaska"},
+    ]
@@ -0,0 +1,44 @@
+import pytest
+from types import SimpleNamespace
+from promise import Promise
+from openstates.data.models import Person
+from .utils import populate_db
+from ..loaders import load_related
+
+
+@pytest.mark.django_db
+def setup():
+    populate_db()
+
+
+@pytest.mark.django_db
+def test_load_related_batches(django_assert_num_queries):
+    people = list(Person.objects.all())
+    info = SimpleNamespace(context=SimpleNamespace())
+
+    with django_assert_num_queries(1):
+        results = Promise.all(
+            [load_related(p, info, "identifiers") for p in people]
+        ).get()
+
+    assert len(results) == len(people)
+    for person, identifiers in zip(people, results):
+        assert all(i.person_id == person.id for i in identifiers)
+
+
+@pytest.mark.django_db
+def test_load_related_no_context():
+    person = Person.objects.all()[0]
+    info = SimpleNamespace(context=None)
+    # without a request to scope a loader to, fall back to the related manager
+    assert list(load_related(person, info, "links")) == list(person.links.all())
+
+
+@pytest.mark.django_db
+def test_load_related_uses_prefetch(django_assert_num_queries):
+    people = list(Person.objects.prefetch_related("links"))
+    info = SimpleNamespace(context=SimpleNamespace())
+
+    with django_assert_num_queries(0):
+        for p in people:
+            list(load_related(p, info, "links"))
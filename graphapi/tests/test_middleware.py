@@ -1,7 +1,12 @@
+import threading
 import pytest
+from types import SimpleNamespace
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from openstates.data.models import Bill
 from graphapi.schema import schema
 from .utils import populate_db
-from ..middleware import QueryProtectionMiddleware
+from ..middleware import QueryBudgetException, QueryProtectionMiddleware, SQLBudget
 
 
 @pytest.mark.django_db
@@ -28,13 +33,11 @@ def test_simple_costs(django_assert_num_queries):
     }""",
         middleware=[QueryProtectionMiddleware(0)],
     )  # max cost to 0 so everything errors
+    # the cost is estimated for the whole operation, so every root field fails
     assert len(result.errors) == 3
-    # one item
-    assert "(1)" in str(result.errors[0])
-    # 100 bills
-    assert "(100)" in str(result.errors[1])
-    # each jurisdiction has 6 items beneath it
-    assert "(6)" in str(result.errors[2])
+    # one item + 100 bills + ~52 jurisdictions with 6 items beneath each
+    for error in result.errors:
+        assert "(413)" in str(error)
 
 
 @pytest.mark.django_db
@@ -51,4 +54,133 @@ def test_fragment_cost(django_assert_num_queries):
         middleware=[QueryProtectionMiddleware(0)],
     )
     assert len(result.errors) == 1
-    assert "(6)" in str(result.errors[0])
+    assert "(312)" in str(result.errors[0])
+
+
+@pytest.mark.django_db
+def test_unbounded_list_cost():
+    result = schema.execute(
+        """{
+        bills(first: 10) { edges { node {
+            actions { description }
+            votes { edges { node { votes { option } } } }
+        } } }
+    }""",
+        middleware=[QueryProtectionMiddleware(0)],
+    )
+    # 10 bills * (20 actions + 5 vote events * 100 votes)
+    assert "(5200)" in str(result.errors[0])
+
+
+@pytest.mark.django_db
+def test_ids_cost():
+    result = schema.execute(
+        """query bills($ids: [String!]!) {
+        billsById(ids: $ids) { actions { description } }
+        nodes(ids: ["ocd-bill/1"]) { ... on BillNode { title } }
+    }""",
+        variables={"ids": ["ocd-bill/1", "ocd-bill/2", "ocd-bill/3"]},
+        middleware=[QueryProtectionMiddleware(0)],
+    )
+    # 3 bills * 20 actions + 1 node
+    assert "(61)" in str(result.errors[0])
+
+
+@pytest.mark.django_db
+def test_cost_limited_by_sql_budget():
+    query = "{ bills(first: 10) { edges { node { actions { description } } } } }"
+    # 10 bills * 20 actions is more rows than the budget allows, so it never runs
+    context = SimpleNamespace(graphql_budget=SQLBudget(queries=10, rows=100))
+    result = schema.execute(
+        query, context_value=context, middleware=[QueryProtectionMiddleware(1000)]
+    )
+    assert "(200), limit is 100" in str(result.errors[0])
+
+    context = SimpleNamespace(graphql_budget=SQLBudget(queries=10, rows=1000))
+    result = schema.execute(
+        query, context_value=context, middleware=[QueryProtectionMiddleware(100)]
+    )
+    assert result.errors is None
+
+
+@pytest.mark.django_db
+def test_export_cost_uses_page_size():
+    query = "{ bills(first: 1) { edges { node { actions { description } } } } }"
+    # every page of an export is 100 bills, whatever first asks for
+    context = SimpleNamespace(graphql_export=object())
+    result = schema.execute(
+        query, context_value=context, middleware=[QueryProtectionMiddleware(1000)]
+    )
+    assert "(2000), limit is 1000" in str(result.errors[0])
+
+    result = schema.execute(
+        query,
+        context_value=SimpleNamespace(),
+        middleware=[QueryProtectionMiddleware(1000)],
+    )
+    assert result.errors is None
+
+
+@pytest.mark.django_db
+def test_sql_budget_rows():
+    budget = SQLBudget(queries=10, rows=2)
+    with pytest.raises(QueryBudgetException, match="budget of 2 rows"):
+        with budget.guard():
+            list(Bill.objects.all())
+    assert budget.rows > 2
+
+
+@pytest.mark.django_db
+def test_sql_budget_queries():
+    budget = SQLBudget(queries=2, rows=1000)
+    with budget.guard():
+        Bill.objects.count()
+        Bill.objects.count()
+        with pytest.raises(QueryBudgetException, match="budget of 2 SQL queries"):
+            Bill.objects.count()
+    # queries after the guard aren't counted
+    Bill.objects.count()
+    assert budget.queries == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_sql_budget_statement_timeout_set_once():
+    if connection.vendor != "postgresql":
+        pytest.skip("statement_timeout is only set on PostgreSQL")
+    with SQLBudget(queries=10, rows=1000, seconds=1).guard():
+        pass
+
+    # the timeout stays on the connection, so it's only set again when it changes
+    with CaptureQueriesContext(connection) as captured:
+        for seconds in (5, 5, 10):
+            with SQLBudget(queries=10, rows=1000, seconds=seconds).guard():
+                Bill.objects.count()
+    sets = [q["sql"] for q in captured if "statement_timeout" in q["sql"]]
+    assert sets == ["SET statement_timeout = 5000", "SET statement_timeout = 10000"]
+
+
+def test_sql_budget_concurrent_threads():
+    budget = SQLBudget(queries=50, rows=1000)
+    executed = []
+
+    def run_queries():
+        for _ in range(20):
+            try:
+                budget._check(
+                    lambda *args: executed.append(1),
+                    "SELECT 1",
+                    [],
+                    False,
+                    {"cursor": None},
+                )
+            except QueryBudgetException:
+                pass
+
+    threads = [threading.Thread(target=run_queries) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # every query is counted, & exactly the budget's queries run
+    assert budget.queries == 160
+    assert len(executed) == 50
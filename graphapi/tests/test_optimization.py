@@ -1,4 +1,9 @@
-from ..optimization import transform_path
+import graphene
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from openstates.data.models import Bill
+from ..common import LinkNode
+from ..optimization import check_relations, transform_path
 
 
 def test_transform_path():
@@ -11,3 +16,32 @@ def test_transform_path():
 
     for input, output in examples:
         assert transform_path(input) == output
+
+
+def test_check_relations_unknown_field():
+    class BrokenBillNode(graphene.ObjectType):
+        title = graphene.String()
+        bogus_links = graphene.List(LinkNode)
+
+        model = Bill
+
+    class Query(graphene.ObjectType):
+        bill = graphene.Field(BrokenBillNode)
+
+    with pytest.raises(ImproperlyConfigured, match="BrokenBillNode.bogus_links"):
+        check_relations(graphene.Schema(query=Query))
+
+
+def test_check_relations_declared():
+    class RenamedBillNode(graphene.ObjectType):
+        title = graphene.String()
+        links = graphene.List(LinkNode)
+        computed = graphene.List(LinkNode)
+
+        model = Bill
+        relations = {"links": "sources", "computed": None}
+
+    class Query(graphene.ObjectType):
+        bill = graphene.Field(RenamedBillNode)
+
+    check_relations(graphene.Schema(query=Query))
@@ -0,0 +1,452 @@
+import datetime
+import gzip
+import json
+import pytest
+from freezegun import freeze_time
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from openstates.data.models import Bill
+from profiles.models import KEY_TIERS, Limit, SQLLimit
+from profiles.verifier import backend
+from web.middleware import _compress_stream, _Gzip
+from .utils import populate_db
+from ..backend import document_hash
+from ..legislative import BillConnection
+
+
+QUERY = '{ bill(id: "ocd-bill/1") { title } }'
+
+
+@pytest.mark.django_db
+def setup():
+    populate_db()
+
+
+@pytest.fixture
+def api_key():
+    caches["default"].clear()
+    u = User.objects.create(username="graphql-user")
+    u.profile.api_key = "graphql-key"
+    u.profile.api_tier = "unlimited"
+    u.profile.save()
+    return u.profile.api_key
+
+
+def _persisted(sha256_hash):
+    return json.dumps({"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}})
+
+
+@pytest.mark.django_db
+def test_graphql_requires_key(client):
+    resp = client.get("/graphql", {"query": QUERY})
+    assert resp.status_code == 403
+
+
+@pytest.mark.django_db
+def test_persisted_query_miss_then_register(client, api_key):
+    sha256_hash = document_hash(QUERY)
+
+    resp = client.get(
+        "/graphql", {"apikey": api_key, "extensions": _persisted(sha256_hash)}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_FOUND"
+
+    # register the full text, then the hash alone is enough
+    resp = client.get(
+        "/graphql",
+        {"apikey": api_key, "query": QUERY, "extensions": _persisted(sha256_hash)},
+    )
+    assert resp.json()["data"]["bill"]["title"] == "Moose Freedom Act"
+
+    resp = client.get(
+        "/graphql", {"apikey": api_key, "extensions": _persisted(sha256_hash)}
+    )
+    assert resp.json()["data"]["bill"]["title"] == "Moose Freedom Act"
+
+
+@pytest.mark.django_db
+def test_persisted_query_hash_mismatch(client, api_key):
+    resp = client.get(
+        "/graphql",
+        {"apikey": api_key, "query": QUERY, "extensions": _persisted("0" * 64)},
+    )
+    assert "does not match" in resp.json()["errors"][0]["message"]
+
+
+@pytest.mark.django_db
+def test_response_cache(client, api_key, settings, django_assert_num_queries):
+    settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT = 60
+    query = '{ bills(jurisdiction: "Alaska", first: 5) { edges { node { id } } } }'
+
+    first = client.get("/graphql", {"apikey": api_key, "query": query})
+    assert first.status_code == 200
+
+    # only the API key lookup runs, the response comes from the cache
+    with django_assert_num_queries(1):
+        second = client.get("/graphql", {"apikey": api_key, "query": query})
+    assert second.json() == first.json()
+
+
+@pytest.mark.django_db
+def test_response_cache_batch(client, api_key, settings):
+    settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT = 60
+    query = '{ bills(jurisdiction: "Alaska", first: 5) { edges { node { id } } } }'
+
+    single = client.get("/graphql", {"apikey": api_key, "query": query})
+    batch = client.post(
+        f"/graphql?apikey={api_key}",
+        json.dumps([{"query": query, "id": 1}, {"query": query, "id": 2}]),
+        content_type="application/json",
+    )
+    # batched responses aren't shared with plain requests or other operation ids
+    assert "id" not in single.json()
+    assert [r["id"] for r in batch.json()] == [1, 2]
+    assert batch.json()[0]["data"] == single.json()["data"]
+
+
+@pytest.mark.django_db
+def test_cost_in_extensions(client, api_key):
+    resp = client.get(
+        "/graphql",
+        {"apikey": api_key, "query": "{ bills(first: 5) { edges { node { id } } } }"},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["extensions"] == {"cost": 5}
+
+
+@pytest.mark.django_db
+def test_pretty_param(client, api_key):
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+    assert b"\n" not in resp.content
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY, "pretty": "1"})
+    assert resp.content.startswith(b'{\n  "data"')
+    assert resp.json()["data"]["bill"]["title"] == "Moose Freedom Act"
+
+
+@pytest.mark.django_db
+def test_profile_requires_header(client, api_key):
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+    assert "profile" not in resp.json()["extensions"]
+
+
+@pytest.mark.django_db
+def test_profile_in_extensions(client, api_key):
+    query = "{ bills(first: 5) { edges { node { id actions { description } } } } }"
+    resp = client.get(
+        "/graphql",
+        {"apikey": api_key, "query": query},
+        HTTP_X_GRAPHQL_PROFILE="1",
+    )
+    profile = resp.json()["extensions"]["profile"]
+    assert profile["cost"] == resp.json()["extensions"]["cost"]
+    resolvers = {r["path"]: r for r in profile["resolvers"]}
+    # the bills & their prefetched actions are fetched by the root resolver
+    assert resolvers["bills"]["queries"] == 2
+    assert resolvers["bills"]["rows"] > 5
+    assert resolvers["bills.edges.node.actions"]["queries"] == 0
+    assert resolvers["bills.edges.node.actions"]["calls"] == 5
+    assert profile["queries"] == 2
+
+
+@pytest.mark.django_db
+def test_profile_unlimited_only(client):
+    caches["default"].clear()
+    u = User.objects.create(username="default-user")
+    u.profile.api_key = "default-key"
+    u.profile.api_tier = "default"
+    u.profile.save()
+    resp = client.get(
+        "/graphql",
+        {"apikey": "default-key", "query": QUERY},
+        HTTP_X_GRAPHQL_PROFILE="1",
+    )
+    assert resp.status_code == 200
+    assert "profile" not in resp.json()["extensions"]
+
+
+@pytest.mark.django_db
+def test_export_streams_every_page(client, api_key, monkeypatch):
+    # pages of 10, so the export takes several pages
+    monkeypatch.setattr(BillConnection, "max_items", 10)
+    query = '{ bills(jurisdiction: "Alaska") { edges { node { id title } } } }'
+    resp = client.get("/graphql/export", {"apikey": api_key, "query": query})
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+    ids = {row["id"] for row in rows}
+    assert len(ids) == len(rows) > 10
+    assert ids == set(
+        Bill.objects.filter(
+            legislative_session__jurisdiction__name="Alaska"
+        ).values_list("id", flat=True)
+    )
+
+
+@pytest.mark.django_db
+def test_export_rate_limited(client, api_key, monkeypatch):
+    monkeypatch.setattr(BillConnection, "max_items", 5)
+    # a burst of 2 pages, & the clock doesn't move so the bucket never refills
+    monkeypatch.setitem(KEY_TIERS["unlimited"], "v2", Limit(1000, 1, 2))
+    query = '{ bills(jurisdiction: "Alaska") { edges { node { id } } } }'
+    with freeze_time():
+        resp = client.get("/graphql/export", {"apikey": api_key, "query": query})
+        lines = [
+            json.loads(line) for line in b"".join(resp.streaming_content).splitlines()
+        ]
+    assert resp.status_code == 200
+
+    # the stream stops instead of waiting, with the cursor to resume from
+    *rows, error = lines
+    assert len(rows) == 10
+    (error,) = error["errors"]
+    assert error["status"] == 429
+    assert "exhausted tokens" in error["message"]
+    assert error["after"]
+
+
+@pytest.mark.django_db
+def test_export_requires_key(client):
+    query = "{ bills { edges { node { id } } } }"
+    resp = client.get("/graphql/export", {"query": query})
+    assert resp.status_code == 403
+
+
+@pytest.mark.django_db
+def test_export_connections_only(client, api_key):
+    for query in (
+        "{ jurisdictions { edges { node { name } } } }",
+        "{ bills { edges { node { id } } } people { edges { node { id } } } }",
+        "{ bills { totalCount } }",
+    ):
+        resp = client.get("/graphql/export", {"apikey": api_key, "query": query})
+        assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_batch(client, api_key):
+    operations = [
+        {"query": QUERY},
+        {"query": "{ bills(first: 5) { edges { node { id } } } }"},
+        {"query": "{ nonexistent }"},
+    ]
+    resp = client.post(
+        f"/graphql?apikey={api_key}",
+        json.dumps(operations),
+        content_type="application/json",
+    )
+    results = resp.json()
+    assert len(results) == 3
+    assert results[0]["data"]["bill"]["title"] == "Moose Freedom Act"
+    assert results[0]["extensions"] == {"cost": 1}
+    assert results[1]["extensions"] == {"cost": 5}
+    # a failing operation doesn't affect the others
+    assert "errors" in results[2]
+    assert "errors" not in results[0] and "errors" not in results[1]
+
+    # every operation is charged to the key
+    quota_range = datetime.datetime.utcnow().strftime("%Y%m%d")
+    assert caches["default"].get(f"{api_key}~v2~{quota_range}") == 3
+
+
+@pytest.mark.django_db
+def test_batch_size_limit(client, api_key):
+    resp = client.post(
+        f"/graphql?apikey={api_key}",
+        json.dumps([{"query": QUERY}] * 26),
+        content_type="application/json",
+    )
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_response_compressed(client, api_key, settings):
+    settings.COMPRESSION = dict(settings.COMPRESSION, min_size=100)
+    query = '{ bills(jurisdiction: "Alaska") { edges { node { id title } } } }'
+    plain = client.get("/graphql", {"apikey": api_key, "query": query})
+    resp = client.get(
+        "/graphql", {"apikey": api_key, "query": query}, HTTP_ACCEPT_ENCODING="gzip"
+    )
+    assert "Content-Encoding" not in plain
+    assert resp["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp["Vary"]
+    assert gzip.decompress(resp.content) == plain.content
+
+    # gzip is the only encoding served, whatever else the client prefers
+    resp = client.get(
+        "/graphql", {"apikey": api_key, "query": query}, HTTP_ACCEPT_ENCODING="br"
+    )
+    assert "Content-Encoding" not in resp
+    resp = client.get(
+        "/graphql",
+        {"apikey": api_key, "query": query},
+        HTTP_ACCEPT_ENCODING="br, gzip;q=0.5",
+    )
+    assert resp["Content-Encoding"] == "gzip"
+
+
+@pytest.mark.django_db
+def test_small_response_not_compressed(client, api_key):
+    resp = client.get(
+        "/graphql", {"apikey": api_key, "query": QUERY}, HTTP_ACCEPT_ENCODING="gzip"
+    )
+    assert "Content-Encoding" not in resp
+
+
+@pytest.mark.django_db
+def test_html_not_compressed(client, settings):
+    settings.COMPRESSION = dict(settings.COMPRESSION, min_size=100)
+    resp = client.get("/graphql", HTTP_ACCEPT="text/html", HTTP_ACCEPT_ENCODING="gzip")
+    assert resp["Content-Type"].startswith("text/html")
+    assert "Content-Encoding" not in resp
+
+
+@pytest.mark.django_db
+def test_export_compressed(client, api_key, monkeypatch):
+    monkeypatch.setattr(BillConnection, "max_items", 10)
+    query = '{ bills(jurisdiction: "Alaska") { edges { node { id title } } } }'
+    resp = client.get(
+        "/graphql/export",
+        {"apikey": api_key, "query": query},
+        HTTP_ACCEPT_ENCODING="gzip",
+    )
+    assert resp["Content-Encoding"] == "gzip"
+    assert not resp.has_header("Content-Length")
+    body = gzip.decompress(b"".join(resp.streaming_content))
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert (
+        len(rows)
+        == Bill.objects.filter(legislative_session__jurisdiction__name="Alaska").count()
+    )
+
+
+def test_compressed_stream_flushed_in_blocks():
+    chunks = [b"x" * 1000 + b"\n"] * 100
+    compressed = list(_compress_stream(_Gzip({"gzip_level": 1}), iter(chunks)))
+    # the header, a flush per 32KB of input & the trailer, not a flush per chunk
+    assert len(compressed) == 5
+    assert gzip.decompress(b"".join(compressed)) == b"".join(chunks)
+
+
+@pytest.mark.django_db
+def test_etag_not_modified(client, api_key, django_assert_num_queries):
+    query = (
+        '{ bills(jurisdiction: "Alaska", updatedSince: "2020-01-01") '
+        "{ edges { node { id } } } }"
+    )
+    # plain requests get the validators that conditional requests replay
+    resp = client.get("/graphql", {"apikey": api_key, "query": query})
+    assert resp.status_code == 200
+    etag = resp["ETag"]
+    assert etag.startswith('W/"')
+    assert resp.has_header("Last-Modified")
+
+    # only the API key lookup & the version query run
+    with django_assert_num_queries(2):
+        resp = client.get(
+            "/graphql", {"apikey": api_key, "query": query}, HTTP_IF_NONE_MATCH=etag
+        )
+    assert resp.status_code == 304
+    assert resp["ETag"] == etag
+    resp = client.get(
+        "/graphql",
+        {"apikey": api_key, "query": query},
+        HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"],
+    )
+    assert resp.status_code == 304
+
+    Bill.objects.filter(legislative_session__jurisdiction__name="Alaska")[0].save()
+    resp = client.get(
+        "/graphql", {"apikey": api_key, "query": query}, HTTP_IF_NONE_MATCH=etag
+    )
+    assert resp.status_code == 200
+    assert resp["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_etag_cached_response(client, api_key, settings):
+    settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT = 60
+    query = '{ bills(jurisdiction: "Alaska", first: 5) { edges { node { id } } } }'
+
+    # cached responses are versioned, & keep their version when served from the cache
+    first = client.get("/graphql", {"apikey": api_key, "query": query})
+    assert first["ETag"].startswith('W/"')
+    second = client.get("/graphql", {"apikey": api_key, "query": query})
+    assert second["ETag"] == first["ETag"]
+
+
+@pytest.mark.django_db
+def test_etag_get_only(client, api_key):
+    resp = client.post(
+        "/graphql?apikey=" + api_key,
+        json.dumps({"query": QUERY}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+    assert not resp.has_header("ETag")
+
+
+@pytest.mark.django_db
+def test_sql_budget_per_tier(client, api_key, monkeypatch):
+    monkeypatch.setitem(KEY_TIERS["unlimited"], "sql", SQLLimit(10, 5, None))
+    query = "{ bills(first: 10) { edges { node { id } } } }"
+    resp = client.get("/graphql", {"apikey": api_key, "query": query})
+    assert "budget of 5 rows" in resp.json()["errors"][0]["message"]
+
+    query = "{ bills(first: 1) { edges { node { id } } } }"
+    resp = client.get("/graphql", {"apikey": api_key, "query": query})
+    assert "errors" not in resp.json()
+
+
+@pytest.mark.django_db
+def test_concurrency_limit(client, api_key, monkeypatch):
+    monkeypatch.setitem(KEY_TIERS["unlimited"], "v2", Limit(1000, 1000, 1000, 1))
+    slot = backend.acquire_slot(api_key, "v2", 1)
+
+    # the key's only slot is taken by another request
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+    assert resp.status_code == 429
+    assert "concurrent" in resp.json()["error"]
+
+    # requests release their slot when they're done
+    backend.release_slot(*slot)
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+    assert resp.status_code == 200
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+    assert resp.status_code == 200
+
+
+@pytest.mark.django_db
+def test_concurrency_limit_export(client, api_key, monkeypatch):
+    monkeypatch.setitem(KEY_TIERS["unlimited"], "v2", Limit(1000, 1000, 1000, 1))
+    query = '{ bills(jurisdiction: "Alaska") { edges { node { id } } } }'
+    export = client.get("/graphql/export", {"apikey": api_key, "query": query})
+    assert export.status_code == 200
+
+    # the slot is held until the stream is consumed
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+    assert resp.status_code == 429
+    b"".join(export.streaming_content)
+    resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+    assert resp.status_code == 200
+
+
+@pytest.mark.django_db
+def test_concurrency_slot_renewed_by_export(client, api_key, monkeypatch):
+    monkeypatch.setattr(BillConnection, "max_items", 5)
+    monkeypatch.setitem(KEY_TIERS["unlimited"], "v2", Limit(1000, 1000, 1000, 1))
+    query = '{ bills(jurisdiction: "Alaska") { edges { node { id } } } }'
+    with freeze_time() as frozen_dt:
+        export = client.get("/graphql/export", {"apikey": api_key, "query": query})
+        chunks = iter(export.streaming_content)
+        # a slow client, the export runs well past the slot's lease
+        for _ in range(5):
+            next(chunks)
+            frozen_dt.tick(datetime.timedelta(seconds=30))
+        assert 5 * 30 > backend.slot_timeout
+
+        resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+        assert resp.status_code == 429
+        list(chunks)
+        resp = client.get("/graphql", {"apikey": api_key, "query": QUERY})
+        assert resp.status_code == 200
@@ -1,17 +1,374 @@
-from graphene_django.views import GraphQLView
-from profiles.verifier import verify_request
+import calendar
+import contextlib
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.http import HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from graphene_django.views import GraphQLView, HttpError
+from profiles.verifier import (
+    charge_requests,
+    get_key_from_request,
+    get_profile_and_limit,
+    verify_request,
+    QuotaError,
+    RateLimitError,
+    VerificationError,
+)
+from utils.serializers import dumps, JsonResponse
+from .backend import CachedDocument
+from .caching import response_cache_key, response_etag, single_flight
+from .middleware import ExecutionProfile, ExportPager, SQLBudget
+from .persisted import resolve_persisted_query, PersistedQueryError
 
 GraphQLView.graphiql_template = "graphene_graphiql_explorer/graphiql.html"
 
 
+def _timestamp(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+
+def _is_conditional(request):
+    return any(
+        header in request.META
+        for header in ("HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE")
+    )
+
+
+def _is_internal(request):
+    return request.get_host() in request.META.get("HTTP_ORIGIN", "")
+
+
 class KeyedGraphQLView(GraphQLView):
-    def get_response(self, request, data, show_graphiql=False):
-        internal = request.get_host() in request.META.get("HTTP_ORIGIN", "")
+    # maximum number of operations in a batch (a JSON array of operations)
+    max_batch_size = 25
+
+    def dispatch(self, request, *args, **kwargs):
+        response = self.dispatch_operations(request, *args, **kwargs)
+
+        # GET requests are versioned before they're executed, see get_response
+        etag = getattr(request, "graphql_etag", None)
+        if response.status_code == 304:
+            response = HttpResponseNotModified()
+        elif response.status_code != 200 or getattr(request, "graphql_errors", False):
+            etag = None
+        if etag:
+            response["ETag"] = etag
+            last_modified = getattr(request, "graphql_last_modified", None)
+            if last_modified:
+                response["Last-Modified"] = http_date(_timestamp(last_modified))
+        return response
+
+    def dispatch_operations(self, request, *args, **kwargs):
+        # a POSTed JSON array is a batch, each operation is executed & cached on its
+        # own but the key is verified once, charging a request per operation
+        self.batch = (
+            request.method == "POST"
+            and request.content_type == "application/json"
+            and request.body.lstrip()[:1] == b"["
+        )
+        if self.batch:
+            try:
+                size = len(json.loads(request.body.decode("utf-8")))
+            except ValueError:
+                # let parse_body report the error
+                size = 1
+            if size > self.max_batch_size:
+                return JsonResponse(
+                    {
+                        "errors": [
+                            {
+                                "message": "batches are limited to "
+                                f"{self.max_batch_size} operations"
+                            }
+                        ]
+                    },
+                    status=400,
+                )
+            if not _is_internal(request):
+                error = verify_request(request, "v2", requests=size)
+                if error:
+                    return error
+                request.graphql_verified = True
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_cached_document(self, request, data):
+        """get (document, operation_name, variables, tier), or None if not cacheable"""
+        try:
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+            document = self.get_backend(request).document_from_string(
+                self.schema, query
+            )
+        except Exception:
+            # let normal execution report the error
+            return None
+        # only valid documents from the document cache have a normalized hash
+        if not isinstance(document, CachedDocument):
+            return None
 
-        # check key only if we're not handling a graphiql request
-        if not show_graphiql and not internal:
+        profile = getattr(request, "api_profile", None)
+        tier = profile.api_tier if profile else "internal"
+        return document, operation_name, variables, tier
+
+    def get_response_cache_key(self, request, data):
+        """get the response cache key for a request, or None if it can't be cached"""
+        if not (
+            settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT or settings.GRAPHQL_COALESCE_TIMEOUT
+        ):
+            return None
+        cached = self.get_cached_document(request, data)
+        if cached is None:
+            return None
+        # batched responses include the operation's id & status, so they're never
+        # shared with non-batch requests (or operations with other ids)
+        batch_id = ["batch", data.get("id")] if self.batch else None
+        return response_cache_key(*cached, batch_id=batch_id)
+
+    def get_etag(self, request, data):
+        """get (etag, last_modified) for a GET request, checked before it's executed"""
+        if request.method != "GET":
+            return None, None
+        cached = self.get_cached_document(request, data)
+        if cached is None:
+            return None, None
+        try:
+            return response_etag(*cached)
+        except Exception:
+            # e.g. arguments the filters can't use, let normal execution report them
+            return None, None
+
+    def get_profile(self, request):
+        """opt-in execution profile, for keys in the unlimited tier only"""
+        if not request.META.get("HTTP_X_GRAPHQL_PROFILE"):
+            return None
+        profile = getattr(request, "api_profile", None)
+        if not profile or profile.api_tier != "unlimited":
+            return None
+        return ExecutionProfile()
+
+    def json_encode(self, request, d, pretty=False):
+        if isinstance(d, dict) and ("data" in d or "errors" in d):
+            extensions = {}
+            # report the estimated cost computed by QueryProtectionMiddleware
+            cost = getattr(request, "graphql_cost", None)
+            if cost is not None:
+                extensions["cost"] = cost
+            profile = getattr(request, "graphql_profile", None)
+            if profile is not None:
+                extensions["profile"] = profile.as_dict(cost)
+            if extensions:
+                d = dict(d, extensions=extensions)
+        return dumps(d, pretty=self.pretty or pretty or bool(request.GET.get("pretty")))
+
+    def execute_graphql_request(self, request, *args, **kwargs):
+        result = super().execute_graphql_request(request, *args, **kwargs)
+        request.graphql_errors = bool(result is None or result.errors)
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        # check key only if we're not handling a graphiql request (or a batch that
+        # was already verified)
+        verified = getattr(request, "graphql_verified", False)
+        if not show_graphiql and not _is_internal(request) and not verified:
             error = verify_request(request, "v2")
             if error:
                 return error, error.status_code
 
-        return super().get_response(request, data, show_graphiql)
+        # cost, profile & version are reported per operation
+        request.graphql_cost = None
+        request.graphql_etag = request.graphql_last_modified = None
+
+        try:
+            data = resolve_persisted_query(request, data)
+        except PersistedQueryError as e:
+            # per the APQ protocol, errors are returned as a normal GraphQL response
+            result = {"errors": [{"message": str(e), "extensions": {"code": e.code}}]}
+            return self.json_encode(request, result), 200
+
+        # profiled requests are always executed, and never cached
+        request.graphql_profile = None
+        if not show_graphiql:
+            request.graphql_profile = self.get_profile(request)
+
+        # GET responses are versioned with a cheap query, so that conditional requests
+        # for unchanged results get a 304 without executing, see get_etag
+        versioned = not show_graphiql and request.graphql_profile is None
+        version = None
+        if versioned and _is_conditional(request):
+            version = self.get_etag(request, data)
+            etag, last_modified = version
+            request.graphql_etag, request.graphql_last_modified = version
+            conditional = etag and get_conditional_response(
+                request,
+                etag=etag,
+                last_modified=last_modified and _timestamp(last_modified),
+            )
+            if conditional:
+                return "", conditional.status_code
+
+        # requests are served from the response cache only after the key was verified
+        # so that rate limits & quotas still apply
+        cache_key = None
+        if versioned:
+            cache_key = self.get_response_cache_key(request, data)
+        cacheable = cache_key and settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT
+        if cacheable:
+            result = caches["default"].get(cache_key)
+            if result is not None:
+                # the version is cached with the response it was computed for
+                body, (request.graphql_etag, request.graphql_last_modified) = result
+                return body, 200
+
+        def execute():
+            # every GET is versioned (before executing, so the response is never older
+            # than its ETag), clients can only make conditional requests with an ETag
+            # or Last-Modified they were given
+            response_version = version
+            if versioned and response_version is None:
+                response_version = self.get_etag(request, data)
+            response = self.execute_response(request, data, show_graphiql)
+            # only successful responses are cached or shared with other requests
+            errors = getattr(request, "graphql_errors", True)
+            return (response, response_version), response[1] == 200 and not errors
+
+        if cache_key and settings.GRAPHQL_COALESCE_TIMEOUT:
+            # identical requests arriving while this one executes share its response
+            (response, version), shared = single_flight(
+                cache_key, execute, settings.GRAPHQL_COALESCE_TIMEOUT
+            )
+        else:
+            (response, version), shared = execute()
+        request.graphql_etag, request.graphql_last_modified = version or (None, None)
+
+        if cacheable and shared:
+            caches["default"].set(
+                cache_key,
+                (response[0], version or (None, None)),
+                settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT,
+            )
+        return response
+
+    def sql_budget(self, request):
+        """limit the SQL of a single operation, per the key's tier"""
+        profile = getattr(request, "api_profile", None)
+        if profile:
+            limit = profile.get_tier_details().get("sql")
+        else:
+            limit = settings.GRAPHQL_INTERNAL_SQL_BUDGET
+        request.graphql_budget = SQLBudget(*limit) if limit else None
+        if request.graphql_budget is None:
+            return contextlib.nullcontext()
+        return request.graphql_budget.guard()
+
+    def execute_response(self, request, data, show_graphiql):
+        with self.sql_budget(request):
+            if request.graphql_profile is not None:
+                with request.graphql_profile:
+                    return super().get_response(request, data, show_graphiql)
+            return super().get_response(request, data, show_graphiql)
+
+
+class GraphQLExportView(KeyedGraphQLView):
+    """
+    stream every node of a bills or people query as newline-delimited JSON
+
+    takes the same queries as the GraphQL endpoint, the root connection is paged
+    through with its largest page size & each page is charged to the API key like
+    a request, so exports are limited by rows instead of by requests
+    """
+
+    def get_middleware(self, request):
+        return [request.graphql_export] + list(super().get_middleware(request))
+
+    def execute_page(self, request, data, query, variables, operation_name):
+        # loaders cache every object they load, start each page with new ones
+        request._graphapi_loaders = None
+        # each page is charged like a request, & gets its own SQL budget
+        with self.sql_budget(request):
+            return self.execute_graphql_request(
+                request, data, query, variables, operation_name
+            )
+
+    def format_errors(self, errors):
+        return {"errors": [self.format_error(e) for e in errors]}
+
+    def dispatch(self, request, *args, **kwargs):
+        error = verify_request(request, "v2")
+        if error:
+            return error
+
+        request.graphql_export = ExportPager()
+        try:
+            data = self.parse_body(request)
+            params = self.get_graphql_params(request, data)[:3]
+            page = self.execute_page(request, data, *params)
+        except HttpError as e:
+            return JsonResponse(self.format_errors([e]), status=e.response.status_code)
+        if page.invalid or page.errors:
+            return JsonResponse(self.format_errors(page.errors), status=400)
+        (nodes,) = page.data.values()
+        if "edges" not in nodes:
+            return JsonResponse(
+                {"errors": [{"message": "exports must select edges { node }"}]},
+                status=400,
+            )
+
+        return StreamingHttpResponse(
+            self.stream(request, page, data, *params),
+            content_type="application/x-ndjson",
+        )
+
+    def stream(self, request, page, data, *params):
+        key = get_key_from_request(request)
+        pager = request.graphql_export
+        limit = None
+        while True:
+            (connection,) = page.data.values()
+            for edge in connection["edges"]:
+                yield dumps(edge["node"]) + "\n"
+            if not pager.has_next_page:
+                return
+
+            # the first page was charged when the request was verified, later pages
+            # are rejected like requests past the limit (a stream can't wait for the
+            # bucket without holding its worker), with the cursor to resume after
+            try:
+                if limit is None:
+                    _, limit = get_profile_and_limit(key, "v2")
+                charge_requests(key, "v2", limit)
+            except (RateLimitError, QuotaError, VerificationError) as e:
+                error = {"message": str(e), "status": 429, "after": pager.after}
+                yield dumps({"errors": [error]}) + "\n"
+                return
+            page = self.execute_page(request, data, *params)
+            if page.errors:
+                yield dumps(self.format_errors(page.errors)) + "\n"
+                return
+
+
+def async_view(view):
+    """
+    serve a synchronous view from an async (ASGI) view
+
+    the view runs in a worker thread instead of the event loop, so requests waiting
+    on the database or outbound HTTP (e.g. geo lookups) don't hold up other requests
+    """
+
+    def run(request, *args, **kwargs):
+        # worker threads outlive requests, manage their connections like Django does
+        close_old_connections()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+    async def handler(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False)(
+            request, *args, **kwargs
+        )
+
+    handler.csrf_exempt = getattr(view, "csrf_exempt", False)
+    return handler
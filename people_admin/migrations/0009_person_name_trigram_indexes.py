@@ -0,0 +1,38 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# trigram indexes for person name search (utils.people.search_people), the plain
+# index serves similarity (%) lookups, the UPPER() index serves icontains
+INDEXES = [
+    ("opencivicdata_person", "name"),
+    ("opencivicdata_personname", "name"),
+]
+
+
+def _create_sql(table, column):
+    return (
+        f"CREATE INDEX IF NOT EXISTS {table}_{column}_trgm "
+        f"ON {table} USING gin ({column} gin_trgm_ops);"
+        f"CREATE INDEX IF NOT EXISTS {table}_{column}_upper_trgm "
+        f"ON {table} USING gin (UPPER({column}) gin_trgm_ops);"
+    )
+
+
+def _drop_sql(table, column):
+    return (
+        f"DROP INDEX IF EXISTS {table}_{column}_trgm;"
+        f"DROP INDEX IF EXISTS {table}_{column}_upper_trgm;"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("people_admin", "0008_newperson"),
+        ("data", "0044_bill_citations"),
+    ]
+
+    operations = [TrigramExtension()] + [
+        migrations.RunSQL(_create_sql(table, column), _drop_sql(table, column))
+        for table, column in INDEXES
+    ]
@@ -1,6 +1,6 @@
 import time
 from structlog import get_logger
-from profiles.verifier import get_key_from_request
+from profiles.verifier import backend, get_key_from_request
 
 logger = get_logger("openstates")
 
@@ -34,3 +34,37 @@ def structlog_middleware(get_response):
         return response
 
     return middleware
+
+
+def _release_after(streaming_content, slot):
+    # streams can outlast the slot's lease, it's renewed while they're being sent
+    renewed = time.monotonic()
+    try:
+        for chunk in streaming_content:
+            if time.monotonic() - renewed >= backend.slot_timeout / 3:
+                backend.renew_slot(*slot)
+                renewed = time.monotonic()
+            yield chunk
+    finally:
+        backend.release_slot(*slot)
+
+
+def concurrency_middleware(get_response):
+    """release the concurrency slot taken by verify_request once a response is done"""
+
+    def middleware(request):
+        response = get_response(request)
+
+        slot = getattr(request, "api_slot", None)
+        if slot:
+            if response.streaming:
+                # streams (e.g. exports) keep the slot until they're consumed
+                response.streaming_content = _release_after(
+                    response.streaming_content, slot
+                )
+            else:
+                backend.release_slot(*slot)
+
+        return response
+
+    return middleware
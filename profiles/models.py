@@ -14,20 +14,41 @@ DAILY = "d"
 WEEKLY = "w"
 
 
-Limit = namedtuple("Limit", "daily_requests requests_per_second burst_size")
+# concurrent_requests is the number of a key's requests that may run at once
+Limit = namedtuple(
+    "Limit",
+    "daily_requests requests_per_second burst_size concurrent_requests",
+    defaults=(None,),
+)
+# SQL actually executed by a single GraphQL request, see graphapi.middleware.SQLBudget
+SQLLimit = namedtuple("SQLLimit", "queries rows seconds")
 KEY_TIERS = {
     "inactive": {"name": "Not Yet Activated"},
     "suspended": {"name": "Suspended"},
     "default": {
         "name": "Default (new user)",
-        "v2": Limit(500, 1, 2),
+        "v2": Limit(500, 1, 2, 2),
+        "sql": SQLLimit(100, 20000, 5),
+    },
+    "legacy": {
+        "name": "Legacy",
+        "v2": Limit(3000, 2, 3, 3),
+        "sql": SQLLimit(200, 100000, 10),
+    },
+    "bronze": {
+        "name": "Bronze",
+        "v2": Limit(3000, 2, 3, 3),
+        "sql": SQLLimit(200, 100000, 10),
+    },
+    "silver": {
+        "name": "Silver",
+        "v2": Limit(30000, 2, 5, 5),
+        "sql": SQLLimit(500, 250000, 15),
     },
-    "legacy": {"name": "Legacy", "v2": Limit(3000, 2, 3)},
-    "bronze": {"name": "Bronze", "v2": Limit(3000, 2, 3)},
-    "silver": {"name": "Silver", "v2": Limit(30000, 2, 5)},
     "unlimited": {
         "name": "Unlimited",
         "v2": Limit(1000000, 100000, 100000),
+        "sql": SQLLimit(2000, 2000000, 30),
     },
 }
 KEY_TIER_CHOICES = [(k, v["name"]) for k, v in KEY_TIERS.items()]
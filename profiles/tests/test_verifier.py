@@ -7,6 +7,7 @@ from ..verifier import (
     CacheBackend,
     verify,
     VerificationError,
+    verify_profile,
     RateLimitError,
     QuotaError,
 )
@@ -76,6 +77,35 @@ def test_get_and_inc_quota_key_and_zone_independence(cb):
     assert cb.get_and_inc_quota_value("key", "zone2", "20170411") == 1
 
 
+def test_acquire_and_release_slot(cb):
+    first = cb.acquire_slot("key", "zone", 2)
+    second = cb.acquire_slot("key", "zone", 2)
+    assert first[0] != second[0]
+    assert cb.acquire_slot("key", "zone", 2) is None
+    assert cb.acquire_slot("key2", "zone", 2) is not None
+    assert cb.acquire_slot("key", "zone2", 2) is not None
+
+    cb.release_slot(*first)
+    assert cb.acquire_slot("key", "zone", 2) is not None
+
+
+def test_renew_slot(cb):
+    slot, token = cb.acquire_slot("key", "zone", 1)
+    assert cb.renew_slot(slot, token)
+    # a lease that expired can't be renewed by its old holder
+    cb.cache.set(slot, "another-token")
+    assert not cb.renew_slot(slot, token)
+    assert cb.cache.get(slot) == "another-token"
+
+
+def test_release_expired_slot(cb):
+    slot, token = cb.acquire_slot("key", "zone", 1)
+    # the lease expired & another request took the slot
+    cb.cache.set(slot, "another-token")
+    cb.release_slot(slot, token)
+    assert cb.cache.get(slot) == "another-token"
+
+
 @pytest.mark.django_db
 def test_verifier_bad_key():
     pytest.raises(VerificationError, verify, "badkey", "bronze")
@@ -143,6 +173,20 @@ def test_verifier_rate_limit_full_refill():
         pytest.raises(RateLimitError, verify, "vrlfr", "premium")
 
 
+@pytest.mark.django_db
+def test_verifier_batch_within_burst():
+    _create_key("vbatch", "bronze")
+
+    with freeze_time():
+        # a batch larger than the burst is rejected without spending tokens
+        pytest.raises(RateLimitError, verify_profile, "vbatch", "default", 11)
+        verify_profile("vbatch", "default", 8)
+        # the bucket never goes negative, only the remaining 2 fit
+        pytest.raises(RateLimitError, verify_profile, "vbatch", "default", 3)
+        verify_profile("vbatch", "default", 2)
+        pytest.raises(RateLimitError, verify, "vbatch", "default")
+
+
 @pytest.mark.django_db
 def test_verifier_rate_limit_key_dependent():
     # ensure that the rate limit is unique per-key
@@ -1,5 +1,6 @@
 import time
 import datetime
+import uuid
 from django.core.cache import caches
 from django.http import JsonResponse
 from .models import Profile
@@ -17,11 +18,18 @@ class QuotaError(Exception):
     pass
 
 
+class ConcurrencyError(Exception):
+    pass
+
+
 class CacheBackend:
     def __init__(self):
         self.cache = caches["default"]
         # keep entries in cache for 48 hours
         self.timeout = 48 * 60 * 60
+        # concurrency slots are leased, so a worker that dies mid-request can't hold
+        # its slot forever
+        self.slot_timeout = 60
 
     def get_tokens_and_timestamp(self, key, zone):
         kz = "{}~{}".format(key, zone)
@@ -31,21 +39,56 @@ class CacheBackend:
         kz = "{}~{}".format(key, zone)
         self.cache.set(kz, (tokens, time.time()), self.timeout)
 
-    def get_and_inc_quota_value(self, key, zone, quota_range):
+    def get_and_inc_quota_value(self, key, zone, quota_range, amount=1):
         quota_key = "{}~{}~{}".format(key, zone, quota_range)
         self.cache.get_or_set(quota_key, lambda: 0, timeout=self.timeout)
         # sometimes calling get_or_set followed by incr leads to an error where the
         # get or set hasn't landed yet, so we'll special case the creation case
         try:
-            return self.cache.incr(quota_key)
+            return self.cache.incr(quota_key, amount)
         except ValueError:
-            return 1
+            return amount
+
+    def acquire_slot(self, key, zone, slots):
+        """lease one of a key's slots, returns (slot, token) or None if all are taken"""
+        slot_keys = ["{}~{}~slot~{}".format(key, zone, n) for n in range(slots)]
+        taken = self.cache.get_many(slot_keys)
+        token = uuid.uuid4().hex
+        for slot in slot_keys:
+            # add only succeeds if no other request holds the slot
+            if slot not in taken and self.cache.add(slot, token, self.slot_timeout):
+                return slot, token
+        return None
+
+    def renew_slot(self, slot, token):
+        """extend the lease of a slot that's still held, returns False if it expired"""
+        if self.cache.get(slot) != token:
+            return False
+        return self.cache.touch(slot, self.slot_timeout)
+
+    def release_slot(self, slot, token):
+        # once a lease expires, the slot may belong to another request
+        if self.cache.get(slot) == token:
+            self.cache.delete(slot)
 
 
 backend = CacheBackend()
 
 
-def verify(key, zone):
+def verify_profile(key, zone, requests=1):
+    """
+    enforce access, rate limits, and quota for key, returning the key's Profile
+
+    requests is the number of requests to charge (e.g. operations in a batch), all
+    of them must fit in the key's bucket, so batches are limited by the burst size
+    """
+    profile, limit = get_profile_and_limit(key, zone)
+    charge_requests(key, zone, limit, requests)
+    return profile
+
+
+def get_profile_and_limit(key, zone):
+    """get the Profile & Limit for a key, if it has access to zone"""
     if not key:
         raise VerificationError("must provide an API key")
     # ensure we have a verified key w/ access to the zone
@@ -57,24 +100,32 @@ def verify(key, zone):
         raise VerificationError("no valid key")
     if not limit:
         raise VerificationError("key does not have access to zone {}".format(zone))
+    return profile, limit
 
-    # enforce rate limiting - will raise RateLimitError if exhausted
-    # replenish first
+
+def available_tokens(key, zone, limit):
+    """get the tokens in key's bucket, replenished for the time since it was used"""
     tokens, last_time = backend.get_tokens_and_timestamp(key, zone)
 
     if last_time is None:
         # if this is the first time, fill the bucket
-        tokens = limit.burst_size
-    else:
-        # increment bucket, careful not to overfill
-        tokens = min(
-            tokens + (limit.requests_per_second * (time.time() - last_time)),
-            limit.burst_size,
-        )
+        return limit.burst_size
+    # increment bucket, careful not to overfill
+    return min(
+        tokens + (limit.requests_per_second * (time.time() - last_time)),
+        limit.burst_size,
+    )
+
+
+def charge_requests(key, zone, limit, requests=1):
+    """charge requests to key, enforcing its rate limit & daily quota"""
+    # enforce rate limiting - will raise RateLimitError if exhausted
+    # replenish first
+    tokens = available_tokens(key, zone, limit)
 
-    # now try to decrement count
-    if tokens >= 1:
-        tokens -= 1
+    # now try to decrement count, the bucket never goes negative
+    if tokens >= requests:
+        tokens -= requests
         backend.set_token_count(key, zone, tokens)
     else:
         raise RateLimitError(
@@ -86,9 +137,15 @@ def verify(key, zone):
     # enforce daily quota
     quota_range = datetime.datetime.utcnow().strftime("%Y%m%d")
 
-    if backend.get_and_inc_quota_value(key, zone, quota_range) > limit.daily_requests:
+    if (
+        backend.get_and_inc_quota_value(key, zone, quota_range, requests)
+        > limit.daily_requests
+    ):
         raise QuotaError(f"quota exceeded: {limit.daily_requests}/day")
 
+
+def verify(key, zone):
+    verify_profile(key, zone)
     return True
 
 
@@ -99,7 +156,7 @@ def get_key_from_request(request):
     return key
 
 
-def verify_request(request, zone):
+def verify_request(request, zone, requests=1):
     ERROR_NOTE = (
         "Login and visit https://openstates.org/account/profile/ for your API key. "
         "contact@openstates.org to raise limits"
@@ -108,13 +165,27 @@ def verify_request(request, zone):
     key = get_key_from_request(request)
 
     try:
-        verify(key, zone)
+        profile, limit = get_profile_and_limit(key, zone)
+        # a slot is held until the response is done, see concurrency_middleware, and
+        # requests are only charged once they have one
+        if limit.concurrent_requests and not getattr(request, "api_slot", None):
+            request.api_slot = backend.acquire_slot(
+                key, zone, limit.concurrent_requests
+            )
+            if request.api_slot is None:
+                raise ConcurrencyError(
+                    f"too many concurrent requests: {limit.concurrent_requests}"
+                )
+        charge_requests(key, zone, limit, requests)
+        request.api_profile = profile
     except VerificationError as e:
         return JsonResponse({"error": str(e), "note": ERROR_NOTE}, status=403)
     except RateLimitError as e:
         return JsonResponse({"error": str(e), "note": ERROR_NOTE}, status=429)
     except QuotaError as e:
         return JsonResponse({"error": str(e), "note": ERROR_NOTE}, status=429)
+    except ConcurrencyError as e:
+        return JsonResponse({"error": str(e), "note": ERROR_NOTE}, status=429)
 
     # pass through
     return None
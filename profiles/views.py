@@ -7,7 +7,8 @@ from django.contrib.auth.models import User
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.shortcuts import redirect, render
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import HttpResponseBadRequest
+from utils.serializers import JsonResponse
 from .models import Subscription, Profile, Notification, WEEKLY
 
 
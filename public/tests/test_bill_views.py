@@ -1,6 +1,6 @@
 import pytest
 from graphapi.tests.utils import populate_db
-from openstates.data.models import Person, VoteEvent
+from openstates.data.models import Bill, Person, VoteEvent
 from testutils.factories import create_test_bill
 
 
@@ -252,3 +252,23 @@ def test_vote_view(client, django_assert_num_queries):
 def test_bills_feed(client):
     resp = client.get("/ak/bills/feed/")
     assert resp.status_code == 200
+
+
+@pytest.mark.django_db
+def test_bills_feed_not_modified(client, django_assert_num_queries):
+    resp = client.get("/ak/bills/feed/")
+    etag = resp["ETag"]
+    assert etag.startswith('W/"')
+
+    # only the version query runs
+    with django_assert_num_queries(1):
+        resp = client.get("/ak/bills/feed/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    resp = client.get("/ak/bills/feed/", HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"])
+    assert resp.status_code == 304
+
+    # any change to the bills in the feed changes its version
+    Bill.objects.filter(legislative_session__jurisdiction__name="Alaska")[0].save()
+    resp = client.get("/ak/bills/feed/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp["ETag"] != etag
@@ -1,9 +1,12 @@
+import calendar
 from collections import defaultdict
 from django.core.paginator import Paginator, EmptyPage
 from django.db.models import Func, Prefetch
 from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404, render, reverse, redirect
+from django.utils.cache import get_conditional_response
 from django.utils.feedgenerator import Rss201rev2Feed
+from django.utils.http import http_date
 from django.views import View
 from django.utils.safestring import mark_safe
 from django.contrib import messages
@@ -15,7 +18,14 @@ from openstates.data.models import (
     Person,
 )
 from openstates.utils.transformers import fix_bill_id
-from utils.common import abbr_to_jid, jid_to_abbr, pretty_url, sessions_with_bills
+from utils.common import (
+    abbr_to_jid,
+    jid_to_abbr,
+    pretty_url,
+    queryset_version,
+    sessions_with_bills,
+    weak_etag,
+)
 from utils.orgs import get_chambers_from_abbr
 from utils.bills import search_bills, EXCLUDED_CLASSIFICATIONS
 from .fallback import fallback
@@ -229,6 +239,20 @@ class BillList(View):
 class BillListFeed(BillList):
     def get(self, request, state):
         bills, form = self.get_bills(request, state)
+
+        # unchanged feeds get a 304 from a cheap version query, before rendering
+        latest, count = queryset_version(bills)
+        etag = weak_etag(latest, count)
+        last_modified = latest and calendar.timegm(latest.utctimetuple())
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified:
+            not_modified["ETag"] = etag
+            if last_modified:
+                not_modified["Last-Modified"] = http_date(last_modified)
+            return not_modified
+
         host = request.get_host()
         link = "https://{}{}?{}".format(
             host,
@@ -263,7 +287,13 @@ class BillListFeed(BillList):
                 unique_id=link,
                 description=description,
             )
-        return HttpResponse(feed.writeString("utf-8"), content_type="application/xml")
+        response = HttpResponse(
+            feed.writeString("utf-8"), content_type="application/xml"
+        )
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
 
 
 def _document_sort_key(doc):
@@ -1,10 +1,10 @@
 from django.shortcuts import get_object_or_404, render, redirect
-from django.http import JsonResponse
 from graphapi.schema import schema
 from openstates.data.models import Person, Bill
 from utils.common import decode_uuid, jid_to_abbr, pretty_url
 from utils.orgs import get_chambers_from_abbr
 from utils.people import person_as_dict
+from utils.serializers import JsonResponse
 
 
 def _people_from_lat_lon(lat, lon):
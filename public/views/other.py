@@ -8,7 +8,7 @@ from django.shortcuts import render
 from openstates.data.models import Bill, Organization, Person
 from utils.common import abbr_to_jid, states, sessions_with_bills, jid_to_abbr
 from utils.bills import search_bills, EXCLUDED_CLASSIFICATIONS
-from utils.people import person_as_dict
+from utils.people import person_as_dict, search_people
 
 
 def styleguide(request):
@@ -159,7 +159,7 @@ def site_search(request):
 
         # people search
         people = []
-        for p in Person.objects.search(query, state=state):
+        for p in search_people(query, state=state, current=True):
             pd = person_as_dict(p)
             pd["current_state"] = jid_to_abbr(p.current_jurisdiction_id).upper()
             people.append(pd)
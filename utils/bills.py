@@ -1,7 +1,7 @@
 import re
-from django.db.models import F
+from django.db.models import Exists, F, OuterRef
 from django.contrib.postgres.search import SearchQuery
-from openstates.data.models import Bill
+from openstates.data.models import Bill, BillAction, BillSponsorship
 from openstates.utils.transformers import fix_bill_id
 from .common import abbr_to_jid
 
@@ -9,6 +9,16 @@ from .common import abbr_to_jid
 EXCLUDED_CLASSIFICATIONS = ["proposed bill"]
 
 
+def has_action(**filters):
+    """filter for bills with an action matching filters, without joining actions"""
+    return Exists(BillAction.objects.filter(bill_id=OuterRef("pk"), **filters))
+
+
+def has_sponsorship(**filters):
+    """filter for bills with a sponsorship matching filters, without joining them"""
+    return Exists(BillSponsorship.objects.filter(bill_id=OuterRef("pk"), **filters))
+
+
 def search_bills(
     *,
     sort,
@@ -46,9 +56,9 @@ def search_bills(
     if session:
         bills = bills.filter(legislative_session__identifier=session)
     if sponsor:
-        bills = bills.filter(sponsorships__person_id=sponsor)
+        bills = bills.filter(has_sponsorship(person_id=sponsor))
     if sponsor_name:
-        bills = bills.filter(sponsorships__name=sponsor_name)
+        bills = bills.filter(has_sponsorship(name=sponsor_name))
     if classification:
         bills = bills.filter(classification__contains=[classification])
     elif exclude_classifications:
@@ -56,20 +66,28 @@ def search_bills(
     if subjects:
         bills = bills.filter(subject__overlap=subjects)
 
+    # status & sponsor filters are EXISTS subqueries, joining actions or sponsorships
+    # would return a bill once per matching row
     if not status:
         status = []
     if "passed-lower-chamber" in status:
         bills = bills.filter(
-            actions__classification__contains=["passage"],
-            actions__organization__classification="lower",
+            has_action(
+                classification__contains=["passage"],
+                organization__classification="lower",
+            )
         )
     elif "passed-upper-chamber" in status:
         bills = bills.filter(
-            actions__classification__contains=["passage"],
-            actions__organization__classification="upper",
+            has_action(
+                classification__contains=["passage"],
+                organization__classification="upper",
+            )
         )
     elif "signed" in status:
-        bills = bills.filter(actions__classification__contains=["executive-signature"])
+        bills = bills.filter(
+            has_action(classification__contains=["executive-signature"])
+        )
 
     if sort is None:
         pass
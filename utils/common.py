@@ -1,8 +1,9 @@
+import hashlib
 import us
 import uuid
 import base62
 from django.utils.text import slugify
-from django.db.models import Count
+from django.db.models import Count, Max
 from openstates.data.models import Person
 from openstates.data.models import Bill, VoteEvent, LegislativeSession
 
@@ -60,3 +61,19 @@ def sessions_with_bills(jid):
         .filter(bill_count__gt=0)
         .order_by("-start_date", "-identifier")
     )
+
+
+def queryset_version(queryset):
+    """
+    get the (latest updated_at, count) of a queryset, in a single aggregate query
+
+    cheap enough to run before a response is built, so unchanged results can be
+    answered with a 304
+    """
+    version = queryset.order_by().aggregate(latest=Max("updated_at"), count=Count("pk"))
+    return version["latest"], version["count"]
+
+
+def weak_etag(*parts):
+    digest = hashlib.sha256("~".join(str(p) for p in parts).encode("utf8"))
+    return f'W/"{digest.hexdigest()}"'
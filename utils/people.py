@@ -1,4 +1,8 @@
-from .common import pretty_url
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Exists, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from openstates.data.models import Membership, Person, PersonName
+from .common import abbr_to_jid, pretty_url
 
 
 def person_as_dict(person):
@@ -10,3 +14,50 @@ def person_as_dict(person):
         "current_role": person.current_role,
         "pretty_url": pretty_url(person),
     }
+
+
+def _name_matches(query):
+    # both conditions are served by the trigram indexes on name & UPPER(name)
+    return Q(name__trigram_similar=query) | Q(name__icontains=query)
+
+
+def search_people(query, *, people=None, state=None, current=False):
+    """
+    find people by name or any of their other names, closest matches first
+
+    names containing query always match, similar names (e.g. misspellings) match
+    above pg_trgm's similarity threshold
+    """
+    if people is None:
+        people = Person.objects.all()
+    if current:
+        people = people.active()
+    if state:
+        people = people.filter(
+            Exists(
+                Membership.objects.filter(
+                    person_id=OuterRef("pk"),
+                    organization__jurisdiction_id=abbr_to_jid(state),
+                )
+            )
+        )
+
+    other_names = PersonName.objects.filter(_name_matches(query))
+    other_similarity = (
+        PersonName.objects.filter(person_id=OuterRef("pk"))
+        .annotate(similarity=TrigramSimilarity("name", query))
+        .order_by("-similarity")
+        .values("similarity")[:1]
+    )
+    return (
+        people.filter(_name_matches(query) | Q(id__in=other_names.values("person_id")))
+        .annotate(
+            name_similarity=Greatest(
+                TrigramSimilarity("name", query),
+                Coalesce(
+                    Subquery(other_similarity, output_field=FloatField()), Value(0.0)
+                ),
+            )
+        )
+        .order_by("-name_similarity", "name")
+    )
@@ -0,0 +1,49 @@
+"""
+fast JSON encoding for API responses
+
+orjson is used when it is installed, otherwise the standard library, both encode
+the dates, Decimals & UUIDs our models return the same way
+"""
+import datetime
+import decimal
+import json
+import uuid
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data, pretty=False):
+    """encode data as a JSON str, pretty output is indented with sorted keys"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+        return orjson.dumps(data, default=_default, option=option).decode("utf-8")
+    if pretty:
+        return json.dumps(data, default=_default, indent=2, sort_keys=True)
+    return json.dumps(data, default=_default, separators=(",", ":"))
+
+
+class JsonResponse(HttpResponse):
+    """drop-in for django.http.JsonResponse, encoding with dumps"""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
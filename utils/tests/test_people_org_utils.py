@@ -1,6 +1,8 @@
 import pytest
+from openstates.data.models import Person
 from graphapi.tests.utils import populate_db
 from utils.orgs import get_chambers_from_abbr, get_legislature_from_abbr
+from utils.people import search_people
 
 
 @pytest.mark.django_db
@@ -15,3 +17,17 @@ def test_get_chambers():
 def test_get_legislature():
     populate_db()
     assert get_legislature_from_abbr("ak").name == "Alaska Legislature"
+
+
+@pytest.mark.django_db
+def test_search_people():
+    populate_db()
+    # misspelled names still match, closest first
+    people = list(search_people("Amanda Adms"))
+    assert people[0].name == "Amanda Adams"
+
+    bob = Person.objects.get(name="Bob Birch")
+    bob.other_names.create(name="Robert Birch")
+    bob.other_names.create(name="Robert B. Birch")
+    assert list(search_people("robert")) == [bob]
+    assert list(search_people("robert", state="wy")) == []
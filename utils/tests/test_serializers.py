@@ -0,0 +1,39 @@
+import datetime
+import decimal
+import json
+import uuid
+import pytest
+from utils.serializers import dumps, JsonResponse
+
+
+def test_dumps_types():
+    data = {
+        "date": datetime.date(2021, 1, 2),
+        "datetime": datetime.datetime(
+            2021, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc
+        ),
+        "decimal": decimal.Decimal("1.50"),
+        "uuid": uuid.UUID("12345678123456781234567812345678"),
+        "list": [1, "two", None, True],
+    }
+    assert json.loads(dumps(data)) == {
+        "date": "2021-01-02",
+        "datetime": "2021-01-02T03:04:05+00:00",
+        "decimal": "1.50",
+        "uuid": "12345678-1234-5678-1234-567812345678",
+        "list": [1, "two", None, True],
+    }
+
+
+def test_dumps_pretty():
+    pretty = dumps({"b": 1, "a": [2]}, pretty=True)
+    assert pretty == '{\n  "a": [\n    2\n  ],\n  "b": 1\n}'
+
+
+def test_json_response():
+    resp = JsonResponse({"ok": True}, status=201)
+    assert resp.status_code == 201
+    assert resp["Content-Type"] == "application/json"
+    assert json.loads(resp.content) == {"ok": True}
+    with pytest.raises(TypeError):
+        JsonResponse([1, 2])
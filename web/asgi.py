@@ -0,0 +1,15 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+try:
+    import newrelic.agent
+
+    newrelic.agent.initialize()
+    newrelic.agent.capture_request_params()
+except Exception as e:
+    print("newrelic couldn't be initialized:", e)
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "web.settings")
+
+application = get_asgi_application()
@@ -0,0 +1,118 @@
+import re
+import zlib
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+
+def compress(**options):
+    """
+    override the COMPRESSION settings (min_size, gzip_level) for a view, e.g.
+    @compress(gzip_level=1), or disable with @compress(enabled=False)
+    """
+
+    def decorator(view):
+        # marked instead of wrapped, so it works the same for sync & async views
+        view.compression = dict(getattr(view, "compression", {}), **options)
+        return view
+
+    return decorator
+
+
+def _accepted_encodings(request):
+    """get the encodings a client accepts (with a non-zero quality)"""
+    accepted = set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = part.strip().partition(";")
+        match = re.search(r"q=([0-9.]+)", params)
+        if match and float(match.group(1)) == 0:
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class _Gzip:
+    name = "gzip"
+    # streams are flushed to the client every flush_size bytes of input, flushing
+    # each (often single line) chunk would end a deflate block per chunk
+    flush_size = 32 * 1024
+
+    def __init__(self, options):
+        # wbits=31 writes a gzip header & trailer
+        self._compressor = zlib.compressobj(options["gzip_level"], zlib.DEFLATED, 31)
+        self._pending = 0
+
+    def process(self, data):
+        compressed = self._compressor.compress(data)
+        self._pending += len(data)
+        if self._pending < self.flush_size:
+            return compressed
+        self._pending = 0
+        return compressed + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def _compress_stream(compressor, chunks):
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    gzip compress dynamic responses, for clients whose Accept-Encoding allows it
+
+    streaming responses are compressed as they're generated, so at most flush_size
+    bytes of them are ever buffered
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.compression = getattr(view_func, "compression", {})
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        options = dict(settings.COMPRESSION, **getattr(request, "compression", {}))
+        if not options.get("enabled", True):
+            return response
+
+        # responses that include a CSRF token are never compressed (BREACH)
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if (
+            response.has_header("Content-Encoding")
+            or content_type not in settings.COMPRESSION_CONTENT_TYPES
+            or request.META.get("CSRF_COOKIE_USED")
+        ):
+            return response
+        if not response.streaming and len(response.content) < options["min_size"]:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if "gzip" not in _accepted_encodings(request):
+            return response
+        compressor = _Gzip(options)
+
+        if response.streaming:
+            response.streaming_content = _compress_stream(
+                compressor, response.streaming_content
+            )
+            # the compressed length isn't known until the stream is done
+            del response["Content-Length"]
+        else:
+            compressed = compressor.process(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # the compressed body differs from the original, so a strong ETag can't match
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = compressor.name
+        return response
@@ -98,8 +98,9 @@ else:
 DATABASE_URL = os.environ.get(
     "DATABASE_URL", "postgis://openstates:openstates@db:5432/openstatesorg"
 )
-DATABASES = {"default": dj_database_url.parse(DATABASE_URL)}
+# connections are reused for this many seconds, by request & GraphQL pool threads
 CONN_MAX_AGE = 60
+DATABASES = {"default": dj_database_url.parse(DATABASE_URL, conn_max_age=CONN_MAX_AGE)}
 
 if "CACHE_URL" in os.environ:
     CACHES = {
@@ -119,6 +120,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.sites",
+    "django.contrib.postgres",
     "captcha",
     "allauth",
     "allauth.account",
@@ -141,6 +143,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "web.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -150,8 +153,29 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "profiles.middleware.structlog_middleware",
+    "profiles.middleware.concurrency_middleware",
 ]
 
+# defaults for web.middleware.CompressionMiddleware, views can override these with
+# the web.middleware.compress decorator
+COMPRESSION = {
+    # smaller responses aren't worth compressing, streams are always compressed
+    "min_size": 1024,
+    "gzip_level": 6,
+}
+# HTML pages mix secrets (CSRF tokens) with reflected input, so they're never
+# compressed to avoid BREACH style attacks
+COMPRESSION_CONTENT_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/rss+xml",
+    "application/xml",
+    "text/csv",
+    "text/plain",
+    "text/xml",
+}
+
 ROOT_URLCONF = "web.urls"
 WSGI_APPLICATION = "web.wsgi.application"
 
@@ -260,6 +284,30 @@ CORS_ALLOW_HEADERS = default_headers + ("x-api-key",)
 
 
 GRAPHENE = {"SCHEMA": "graphapi.schema.schema", "MIDDLEWARE": []}
+# SQL (queries, rows, seconds per query) that GraphQL requests from the site itself
+# may execute, API keys get the budget of their tier, see profiles.models.KEY_TIERS
+GRAPHQL_INTERNAL_SQL_BUDGET = (500, 250000, 15)
+# maximum estimated number of rows a single GraphQL operation may touch, requests
+# with a SQL budget are limited to its rows instead, so this only applies without one
+GRAPHQL_MAX_QUERY_COST = int(
+    os.environ.get("GRAPHQL_MAX_QUERY_COST", GRAPHQL_INTERNAL_SQL_BUDGET[1])
+)
+# threads per process that root fields of /graphql/async are resolved in
+GRAPHQL_ROOT_FIELD_THREADS = int(os.environ.get("GRAPHQL_ROOT_FIELD_THREADS", 8))
+# number of parsed & validated GraphQL documents to keep per process
+GRAPHQL_DOCUMENT_CACHE_SIZE = int(os.environ.get("GRAPHQL_DOCUMENT_CACHE_SIZE", 500))
+# how long (in seconds) automatic persisted queries are kept in the shared cache
+GRAPHQL_PERSISTED_QUERY_TIMEOUT = 7 * 24 * 60 * 60
+# cache complete GraphQL responses for this many seconds (0 disables the cache),
+# entries are also invalidated whenever a new scrape of their jurisdiction lands
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = int(
+    os.environ.get("GRAPHQL_RESPONSE_CACHE_TIMEOUT", 0)
+)
+# how often (in seconds) to recheck the latest scrape for each jurisdiction
+GRAPHQL_RESPONSE_CACHE_VERSION_TIMEOUT = 60
+# identical GraphQL requests arriving while one is executing wait up to this many
+# seconds to share its response instead of executing again (0, the default, disables)
+GRAPHQL_COALESCE_TIMEOUT = int(os.environ.get("GRAPHQL_COALESCE_TIMEOUT", 0))
 
 
 # structlog config
@@ -3,10 +3,21 @@ from django.conf import settings
 from django.contrib import admin
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView, RedirectView
-from graphapi.views import KeyedGraphQLView
-from graphapi.middleware import QueryProtectionMiddleware
+from graphapi.views import GraphQLExportView, KeyedGraphQLView, async_view
+from graphapi.backend import CachedGraphQLBackend
+from graphapi.executors import ConcurrentRootExecutor
+from graphapi.middleware import ProfilingMiddleware, QueryProtectionMiddleware
 from bundles.views import bundle_view
+from .middleware import compress
 
+graphql_options = dict(
+    graphiql=True,
+    backend=CachedGraphQLBackend(settings.GRAPHQL_DOCUMENT_CACHE_SIZE),
+    middleware=[
+        ProfilingMiddleware(),
+        QueryProtectionMiddleware(settings.GRAPHQL_MAX_QUERY_COST),
+    ],
+)
 
 urlpatterns = [
     path("djadmin/", admin.site.urls),
@@ -14,14 +25,26 @@ urlpatterns = [
     path("accounts/", include("allauth.urls")),
     path("accounts/profile/", include("profiles.urls")),
     path("dashboard/", include("dashboards.urls")),
+    re_path("^graphql/?$", csrf_exempt(KeyedGraphQLView.as_view(**graphql_options))),
+    # for ASGI deployments, root fields are resolved concurrently
     re_path(
-        "^graphql/?$",
-        csrf_exempt(
-            KeyedGraphQLView.as_view(
-                graphiql=True, middleware=[QueryProtectionMiddleware(5000)]
+        "^graphql/async/?$",
+        async_view(
+            csrf_exempt(
+                KeyedGraphQLView.as_view(
+                    executor=ConcurrentRootExecutor(), **graphql_options
+                )
             )
         ),
     ),
+    # bills & people queries streamed as newline-delimited JSON, without a page limit
+    # (compressed at the fastest level, exports are large & sent as they're built)
+    re_path(
+        "^graphql/export/?$",
+        compress(gzip_level=1)(
+            csrf_exempt(GraphQLExportView.as_view(**graphql_options))
+        ),
+    ),
     path("", include("public.urls")),
     path("", include("web.redirects")),
     path("data/", include("bulk.urls")),